@@ -0,0 +1,86 @@
+"""Peak memory of an audit on 100k and 1M line inputs.
+
+Audits store their content in columns (a list of lines, a bytearray of
+statuses and an array of cause ids) instead of one object per line. The
+former layout is modelled by `LegacyLine` for comparison. Zero-copy
+audits do not split the content into line strings at all and file audits
+do not even read the content into memory (mapped pages are not counted).
+
+    $ python benchmarks/bench_audit_memory.py
+"""
+from __future__ import annotations
+
+import gc
+import pathlib
+import tempfile
+import tracemalloc
+
+from pytest_patterns.plugin import PatternsLib, Status
+
+SIZES = [100_000, 1_000_000]
+
+
+class LegacyLine:
+    # The former per-line object, with status and cause in its __dict__.
+    status = Status.UNEXPECTED
+    status_cause = ""
+
+    def __init__(self, data: str):
+        self.data = data
+
+
+def make_content(size: int) -> str:
+    return "\n".join(
+        f"Oct 18 12:00:{i % 60:02d} host systemd[1]: Started unit-{i}.service"
+        for i in range(size)
+    )
+
+
+def measure(function) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def legacy(content: str) -> list[LegacyLine]:
+    lines = [LegacyLine(line) for line in content.splitlines()]
+    for line in lines:
+        line.status = Status.OPTIONAL
+        line.status_cause = "journal"
+    return lines
+
+
+def main() -> None:
+    patterns = PatternsLib(keep_audit=False)
+    patterns.journal.optional("... host systemd[1]: ...")
+    zero_copy = PatternsLib(keep_audit=False, zero_copy=True)
+    zero_copy.journal.optional("... host systemd[1]: ...")
+    print(
+        f"{'lines':>10} {'legacy (MiB)':>13} {'columnar (MiB)':>15} "
+        f"{'zero-copy (MiB)':>16} {'file (MiB)':>11}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "journal.log"
+        for size in SIZES:
+            content = make_content(size)
+            path.write_text(content)
+            before = measure(lambda: legacy(content))  # noqa: B023
+            after = measure(
+                lambda: patterns.journal._audit(content)  # noqa: B023
+            )
+            lazy = measure(
+                lambda: zero_copy.journal._audit(content)  # noqa: B023
+            )
+            mapped = measure(lambda: patterns.journal.audit_file(path))
+            print(
+                f"{size:>10} {before / 2**20:>13.1f} {after / 2**20:>15.1f} "
+                f"{lazy / 2**20:>16.1f} {mapped / 2**20:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
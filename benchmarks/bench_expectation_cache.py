@@ -0,0 +1,68 @@
+"""Audit time versus the number of distinct expectation lines.
+
+The `re` module keeps an internal cache of 512 compiled patterns. Before
+expectations were compiled explicitly, merged patterns with more distinct
+lines than that recompiled every expectation for every content line. This
+compares that behaviour with the compiled expectations around the boundary.
+
+    $ python benchmarks/bench_expectation_cache.py
+"""
+from __future__ import annotations
+
+import re
+import time
+
+from pytest_patterns.plugin import PatternsLib, tab_replace
+
+CONTENT_LINES = 100
+DISTINCT_LINES = [128, 256, 384, 512, 640, 768, 1024]
+
+
+def legacy_match(pattern: str, line: str) -> re.Match[str] | None:
+    # The former implementation of `match()`, compiling on every call.
+    line = tab_replace(line)
+    pattern = re.escape(pattern)
+    pattern = pattern.replace(r"\.\.\.", ".*?")
+    return re.compile("^" + pattern + "$").match(line)
+
+
+def make_pattern_lines(count: int) -> list[str]:
+    return [f"service-{i} ... event={i % 7}" for i in range(count)]
+
+
+def make_content(count: int) -> str:
+    return "\n".join(
+        f"service-{i * 37 % count} did something event={i % 7}"
+        for i in range(CONTENT_LINES)
+    )
+
+
+def bench_legacy(pattern_lines: list[str], content: str) -> float:
+    lines = content.splitlines()
+    start = time.perf_counter()
+    for pattern in pattern_lines:
+        for line in lines:
+            legacy_match(pattern, line)
+    return time.perf_counter() - start
+
+
+def bench_compiled(pattern_lines: list[str], content: str) -> float:
+    patterns = PatternsLib()
+    patterns.noise.optional("\n".join(pattern_lines))
+    start = time.perf_counter()
+    patterns.noise._audit(content)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'distinct lines':>15} {'legacy (s)':>12} {'compiled (s)':>13}")
+    for count in DISTINCT_LINES:
+        pattern_lines = make_pattern_lines(count)
+        content = make_content(count)
+        legacy = bench_legacy(pattern_lines, content)
+        compiled = bench_compiled(pattern_lines, content)
+        print(f"{count:>15} {legacy:>12.4f} {compiled:>13.4f}")
+
+
+if __name__ == "__main__":
+    main()
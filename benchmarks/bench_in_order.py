@@ -0,0 +1,51 @@
+"""Cost of `in_order` patterns whose first expectations do not occur.
+
+Until an expectation matched, every unmatched expectation restarts the
+search at the first line. Scanning the content again for each following
+expectation costs O(expectations x lines); classifying all lines once and
+bisecting the positions of each expectation is linear. Lines are only
+classified if enough expectations are left for this to pay off.
+`ScanningAudit` keeps the former behaviour for comparison.
+
+    $ python benchmarks/bench_in_order.py
+"""
+from __future__ import annotations
+
+import time
+
+from pytest_patterns.plugin import Audit, ExpectationGroup, PatternsLib
+
+LINES = 100_000
+MISSING = [0, 1, 5, 20, 50]
+
+
+class ScanningAudit(Audit):
+    def classify(self, group: ExpectationGroup) -> None:
+        pass
+
+
+def main() -> None:
+    content = "\n".join(
+        f"Oct 18 12:00:{i % 60:02d} host app[{i % 7}]: request {i} done"
+        for i in range(LINES)
+    )
+    print(f"{'missing':>8} {'scanning (s)':>13} {'classified (s)':>15}")
+    for missing in MISSING:
+        pattern = PatternsLib().ordered
+        pattern.in_order(
+            "\n".join(
+                [f"... host app[...]: error {i} ..." for i in range(missing)]
+                + ["... request 10 done", "... request 99999 done"]
+            )
+        )
+        results = []
+        for audit_type in [ScanningAudit, Audit]:
+            audit = audit_type(content)
+            start = time.perf_counter()
+            audit.run(pattern.flat_ops())
+            results.append(time.perf_counter() - start)
+        print(f"{missing:>8} {results[0]:>13.3f} {results[1]:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
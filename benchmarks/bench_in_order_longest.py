@@ -0,0 +1,73 @@
+"""Greedy `in_order` against `in_order(..., longest=True)`.
+
+The longest mode computes the longest common subsequence of expectations
+and lines from the positions of the lines matching each expectation, so
+its cost grows with the number of matches instead of expectations x lines.
+The patterns expect every 100th line of a log of 100k lines, some of them
+missing or preceded by expectations matching many lines.
+
+    $ python benchmarks/bench_in_order_longest.py
+    $ python benchmarks/bench_in_order_longest.py --lines 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from bench_suite import service_logs
+
+from pytest_patterns.plugin import PatternsLib
+
+LINES = 100_000
+STEP = 100
+MISSING = 0.1
+
+
+def patterns(lines: list[str], rng: random.Random) -> dict[str, list[str]]:
+    sampled = lines[::STEP]
+    missing = [
+        line if rng.random() > MISSING else line + " (missing)"
+        for line in sampled
+    ]
+    return {
+        "sampled": sampled,
+        "missing": missing,
+        # Wildcards matching about a third of all lines, in between.
+        "wildcards": [
+            expected
+            for line in missing
+            for expected in (line, "... worker[...]: task ...")
+        ],
+        # A greedy match of the first expectation skips all others.
+        "misleading": ["... cron[...]: ...", *sampled],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lines", type=int, default=LINES)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    content = service_logs(args.lines, rng).passing
+    print(f"{args.lines} lines")
+    print(
+        f"{'patterns':>10} {'expected':>9} {'greedy (s)':>11} {'matched':>8} "
+        f"{'longest (s)':>12} {'matched':>8}"
+    )
+    for name, expected in patterns(content.splitlines(), rng).items():
+        results = []
+        for longest in [False, True]:
+            pattern = PatternsLib(keep_audit=False).ordered
+            pattern.in_order("\n".join(expected), longest=longest)
+            start = time.perf_counter()
+            audit = pattern._audit(content)
+            duration = time.perf_counter() - start
+            matched = len(expected) - len(audit.unmatched_expectations)
+            results.append(f"{duration:>11.3f} {matched:>8}")
+        print(f"{name:>10} {len(expected):>9} {results[0]} {results[1]:>21}")
+
+
+if __name__ == "__main__":
+    main()
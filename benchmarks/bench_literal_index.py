@@ -0,0 +1,71 @@
+"""Audit time for literal-heavy versus wildcard-heavy pattern sets.
+
+Literal expectations (without `...`) are answered from an index of the
+content lines, wildcard expectations are checked against their longest
+fixed chunk before any regular expression runs.
+
+    $ python benchmarks/bench_literal_index.py
+"""
+from __future__ import annotations
+
+import random
+import time
+
+from pytest_patterns.plugin import PatternsLib
+
+CONTENT_LINES = 100_000
+EVENTS = [
+    "heartbeat-ping",
+    "acquire-lock",
+    "release-lock",
+    "query-status",
+    "migration-status",
+    "consul-register",
+]
+
+
+def make_content(rng: random.Random) -> list[str]:
+    return [
+        f"vm{rng.randint(0, 49):02d}  {rng.choice(EVENTS):<20} "
+        f"subsystem='qemu' id={rng.randint(0, 199)}"
+        for _ in range(CONTENT_LINES)
+    ]
+
+
+def define(patterns: PatternsLib, content: list[str], *, wildcards: bool):
+    def line(text: str) -> str:
+        if not wildcards:
+            return text
+        # Keep the line recognisable but replace the variable part.
+        return text.rsplit("id=", 1)[0] + "id=..."
+
+    pattern = patterns.log
+    pattern.in_order("\n".join(line(text) for text in content[::5000]))
+    pattern.continuous("\n".join(line(text) for text in content[500:503]))
+    pattern.optional("\n".join(line(text) for text in content[:200]))
+    pattern.refused(
+        "\n".join(
+            line(f"vm{i:02d}  {'fatal-error':<20} subsystem='qemu' id={i}")
+            for i in range(20)
+        )
+    )
+    return pattern
+
+
+def main() -> None:
+    rng = random.Random(0)
+    content = make_content(rng)
+    text = "\n".join(content)
+    print(f"{'pattern set':>15} {'audit (s)':>10}")
+    for label, wildcards in [
+        ("literal-heavy", False),
+        ("wildcard-heavy", True),
+    ]:
+        pattern = define(PatternsLib(), content, wildcards=wildcards)
+        start = time.perf_counter()
+        pattern._audit(text)
+        print(f"{label:>15} {time.perf_counter() - start:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
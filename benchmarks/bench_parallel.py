@@ -0,0 +1,62 @@
+"""Scaling of parallel audits with 1, 2, 4, 8 and 16 workers.
+
+The content is a log of 2M lines (see `bench_suite.py`) audited with a
+pattern of all four op types. Optional and refused ops are split into one
+chunk of lines per worker, in_order and continuous ops run in the parent
+meanwhile. Workers read the content from shared memory. The speedup is
+bounded by the number of cores and by the sequential parts: splitting the
+content into lines, the in_order and continuous ops and merging the
+statuses.
+
+Only single-core results exist so far, where workers are pure overhead:
+
+     workers  audit (s)  speedup
+           1      7.928    1.00x
+           2     11.522    0.69x
+           4      8.943    0.89x
+           8     10.839    0.73x
+          16     11.074    0.72x
+
+    $ python benchmarks/bench_parallel.py
+    $ python benchmarks/bench_parallel.py --lines 200000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import time
+
+from bench_suite import OPS, service_logs
+
+from pytest_patterns.plugin import PatternsLib
+
+LINES = 2_000_000
+WORKERS = [1, 2, 4, 8, 16]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lines", type=int, default=LINES)
+    args = parser.parse_args()
+
+    workload = service_logs(args.lines, random.Random(0))
+    print(f"{args.lines} lines, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'audit (s)':>10} {'speedup':>8}")
+    baseline = None
+    for workers in WORKERS:
+        patterns = PatternsLib(keep_audit=False, workers=workers)
+        for op in OPS:
+            getattr(getattr(patterns, op), op)("\n".join(workload.patterns[op]))
+            patterns.merged.merge(op)
+        # Start the workers before measuring.
+        patterns.merged._audit(workload.failing)
+        start = time.perf_counter()
+        patterns.merged._audit(workload.failing)
+        duration = time.perf_counter() - start
+        baseline = baseline or duration
+        print(f"{workers:>8} {duration:>10.3f} {baseline / duration:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Suite overhead of shared pattern definitions: 1,000 tests reusing the
+same 50 patterns.
+
+With a function-scoped fixture every test parses and compiles all patterns
+again. A session-scoped library is compiled once, frozen, and each test
+derives a copy-on-write library from it.
+
+    $ python benchmarks/bench_session_library.py
+"""
+from __future__ import annotations
+
+import pathlib
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+TESTS = 1000
+PATTERNS = 50
+
+DEFINITIONS = f"""
+def define(patterns):
+    for i in range({PATTERNS}):
+        pattern = getattr(patterns, f"shared{{i}}")
+        pattern.optional(
+            "\\n".join(f"service-{{i}} line {{j}} ..." for j in range(20))
+        )
+        pattern.refused(f"...service-{{i}} failed...")
+        if i:
+            pattern.merge(f"shared{{i - 1}}")
+    patterns.all.merge(*[f"shared{{i}}" for i in range({PATTERNS})])
+"""
+
+FUNCTION_SCOPED = (
+    DEFINITIONS
+    + """
+import pytest
+
+@pytest.fixture
+def shared(patterns):
+    define(patterns)
+    return patterns
+"""
+)
+
+SESSION_SCOPED = (
+    DEFINITIONS
+    + """
+import pytest
+
+@pytest.fixture(scope="session")
+def shared_library(session_patterns):
+    define(session_patterns)
+    session_patterns.freeze()
+    return session_patterns
+
+@pytest.fixture
+def shared(shared_library):
+    return shared_library.derive()
+"""
+)
+
+TEST_MODULE = f"""
+import pytest
+
+@pytest.mark.parametrize("i", range({TESTS}))
+def test_output(shared, i):
+    shared.test.merge("all")
+    shared.test.in_order(f"result {{i}}")
+    assert shared.test == f"service-1 line 2 ok\\nresult {{i}}"
+"""
+
+
+def run_suite(conftest: str) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp)
+        (path / "conftest.py").write_text(textwrap.dedent(conftest))
+        (path / "test_output.py").write_text(textwrap.dedent(TEST_MODULE))
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"],
+            cwd=path,
+            check=True,
+            capture_output=True,
+        )
+        return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{TESTS} tests, {PATTERNS} shared patterns")
+    print(f"function-scoped definitions: {run_suite(FUNCTION_SCOPED):.2f}s")
+    print(f"session library + derive():  {run_suite(SESSION_SCOPED):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""Benchmark suite for the matching engine.
+
+Synthetic but realistic outputs (interleaved service logs, iCal dumps, HTML
+and tab separated tables) are generated at several sizes. Each workload
+defines one pattern per op type and a pattern merging all of them. For
+every workload and size the suite measures:
+
+* `audit:<op>`: a complete audit with a single op type,
+* `audit:merged`: a complete audit with the merged pattern,
+* `compare:pass` and `compare:fail`: comparisons as in `assert`,
+* `report:full` and `report:collapsed`: rendering the failure report
+  completely and with 3 lines of context.
+
+The best of `--repeat` runs is reported. Results can be written as JSON and
+compared with the results of another version:
+
+    $ python benchmarks/bench_suite.py --output before.json
+    $ git checkout ...
+    $ python benchmarks/bench_suite.py --compare before.json
+    $ python benchmarks/bench_suite.py --sizes 1000000 --workloads logs
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import pathlib
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable
+
+from pytest_patterns.__about__ import __version__
+from pytest_patterns.plugin import PatternsLib
+
+SIZES = [1_000, 10_000, 100_000]
+REPEAT = 3
+OPS = ["optional", "refused", "in_order", "continuous"]
+REPORT_CONTEXT = 3
+
+
+class Workload:
+    """Passing and failing content of a given size and the patterns to
+    audit it with."""
+
+    def __init__(
+        self,
+        passing: list[str],
+        failing: list[str],
+        patterns: dict[str, list[str]],
+    ):
+        self.passing = "\n".join(passing)
+        self.failing = "\n".join(failing)
+        self.patterns = patterns
+
+    def library(self) -> PatternsLib:
+        # Comparisons must not reuse audits of earlier runs.
+        patterns = PatternsLib(keep_audit=False)
+        for op in OPS:
+            getattr(getattr(patterns, op), op)("\n".join(self.patterns[op]))
+            patterns.merged.merge(op)
+        return patterns
+
+
+SERVICES = {
+    "nginx": [
+        "GET /api/items/{i} HTTP/1.1 200 {n}",
+        "POST /api/orders HTTP/1.1 201 {n}",
+        "GET /static/app-{i}.js HTTP/1.1 304 0",
+    ],
+    "postgres": [
+        "LOG:  duration: {n} ms  statement: SELECT * FROM items WHERE id={i}",
+        "LOG:  checkpoint complete: wrote {n} buffers",
+    ],
+    "redis": ["{n}:M DB saved on disk", "{n}:M Background saving started"],
+    "worker": [
+        "task {i} finished in {n}ms",
+        "task {i} received",
+        "retrying task {i} in {n}s",
+    ],
+    "cron": ["(root) CMD (run-parts /etc/cron.hourly)"],
+}
+
+
+def service_logs(size: int, rng: random.Random) -> Workload:
+    def stamp(i: int) -> str:
+        return f"Oct 18 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+
+    startup = [
+        f"{stamp(0)} host systemd[1]: Started {service}.service."
+        for service in SERVICES
+    ]
+    shutdown = [
+        f"{stamp(size)} host systemd[1]: Stopping {service}.service..."
+        for service in SERVICES
+    ]
+    lines = startup.copy()
+    for i in range(len(startup), size - len(shutdown)):
+        service = rng.choice(list(SERVICES))
+        message = rng.choice(SERVICES[service]).format(
+            i=i, n=rng.randint(1, 9999)
+        )
+        lines.append(f"{stamp(i)} host {service}[{100 + i % 7}]: {message}")
+    lines.extend(shutdown)
+
+    failing = lines.copy()
+    del failing[len(startup) // 2]
+    failing[size // 2] = f"{stamp(size // 2)} host worker[1]: FATAL: no memory"
+    patterns = {
+        "optional": [
+            "... host {}[...]: {}".format(
+                service, message.format(i="...", n="...")
+            )
+            for service, messages in SERVICES.items()
+            for message in messages
+        ],
+        "refused": ["...Traceback...", "... segfault ...", "...FATAL..."],
+        "in_order": ["..." + line.split(" host ", 1)[1] for line in startup],
+        "continuous": ["... " + line.split(" ", 3)[3] for line in shutdown],
+    }
+    return Workload(lines, failing, patterns)
+
+
+NAMES = ["cedric", "alice", "bob", "carol", "dave"]
+
+
+def ical_event(i: int) -> list[str]:
+    day = dt.date(2011, 2, 1) + dt.timedelta(days=i)
+    return [
+        "BEGIN:VEVENT",
+        f"SUMMARY:{NAMES[i % len(NAMES)]} (1\\, platform)",
+        f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{day:%Y%m%d}",
+        "DTSTAMP;VALUE=DATE-TIME:19700101T000140Z",
+        f"UID:{i:064x}",
+        "END:VEVENT",
+        "",
+    ]
+
+
+def ical(size: int, rng: random.Random) -> Workload:
+    header = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//fc.support//fcio//"]
+    lines = header.copy()
+    event = 0
+    while len(lines) < size - 1:
+        lines.extend(ical_event(event))
+        event += 1
+    del lines[size - 1 :]
+    lines.append("END:VCALENDAR")
+
+    middle = ical_event(event // 2)
+    start = lines.index(middle[5])
+    failing = lines.copy()
+    # Break the continuous event and add a refused one.
+    failing[start - 2] = "DTEND;VALUE=DATE:19700101"
+    failing[len(header) + 1] = "SUMMARY:mallory (1\\, platform)"
+    patterns = {
+        "optional": [
+            "BEGIN:VEVENT",
+            "SUMMARY:... (1\\, platform)",
+            "DTSTART;VALUE=DATE:...",
+            "DTEND;VALUE=DATE:...",
+            "DTSTAMP;VALUE=DATE-TIME:...",
+            "UID:...",
+            "END:VEVENT",
+            "<empty-line>",
+        ],
+        "refused": ["SUMMARY:mallory...", "SUMMARY:eve..."],
+        "in_order": [*header, "END:VCALENDAR"],
+        # Starts at the first line that is unique to the event.
+        "continuous": middle[2:-1],
+    }
+    return Workload(lines, failing, patterns)
+
+
+def html(size: int, rng: random.Random) -> Workload:
+    header = ["<!DOCTYPE html>", "<html>", "  <body>"]
+    footer = [
+        "    <footer>",
+        "      <p>Generated by pytest-patterns</p>",
+        "    </footer>",
+        "  </body>",
+        "</html>",
+    ]
+    lines = header.copy()
+    for i in range(size - len(header) - len(footer)):
+        if i % 50 == 0:
+            lines.append("    <ul>" if i % 100 == 0 else "    </ul>")
+            continue
+        lines.append(
+            f'      <li class="item"><a href="/item/{i}">'
+            f"Item {rng.randint(0, 999)}</a></li>"
+        )
+    lines.extend(footer)
+
+    failing = lines.copy()
+    failing[size // 2] = '      <img src="x" onerror="alert(1)">'
+    failing[-4] = "      <p>Generated by something else</p>"
+    patterns = {
+        "optional": [
+            '      <li class="item"><a href="/item/...">Item ...</a></li>',
+            "    <ul>",
+            "    </ul>",
+        ],
+        "refused": ["...<script...", "...onerror=..."],
+        "in_order": header + footer[-2:],
+        "continuous": footer[:3],
+    }
+    return Workload(lines, failing, patterns)
+
+
+def tables(size: int, rng: random.Random) -> Workload:
+    header = "name\tsize\towner\tmodified"
+    footer = ["-----", f"total\t{size}"]
+    lines = [header]
+    for i in range(size - 1 - len(footer)):
+        lines.append(
+            f"file-{i}.txt\t{rng.randint(0, 10**6)}\t"
+            f"user{rng.randint(0, 9)}\t2024-10-{rng.randint(1, 31):02d}"
+        )
+    lines.extend(footer)
+
+    failing = lines.copy()
+    failing[size // 2] = "file-x.txt\t???\troot\tpermission denied"
+    del failing[-1]
+    patterns = {
+        "optional": ["file-....txt ... user... 2024-..."],
+        "refused": ["...permission denied..."],
+        "in_order": ["name    size    owner   modified"],
+        "continuous": ["-----", "total   ..."],
+    }
+    return Workload(lines, failing, patterns)
+
+
+WORKLOADS: dict[str, Callable[[int, random.Random], Workload]] = {
+    "logs": service_logs,
+    "ical": ical,
+    "html": html,
+    "tables": tables,
+}
+
+
+def measure(function: Callable[[], Any], repeat: int) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def cases(workload: Workload) -> dict[str, Callable[[], Any]]:
+    patterns = workload.library()
+    merged = patterns.merged
+    if not merged == workload.passing:
+        msg = "The passing content does not pass."
+        raise SystemExit(msg)
+    if merged == workload.failing:
+        msg = "The failing content does not fail."
+        raise SystemExit(msg)
+    failed = merged._audit(workload.failing)
+    result: dict[str, Callable[[], Any]] = {
+        f"audit:{op}": (
+            lambda op=op: getattr(patterns, op)._audit(workload.passing)
+        )
+        for op in OPS
+    }
+    result.update(
+        {
+            "audit:merged": lambda: merged._audit(workload.passing),
+            "compare:pass": lambda: merged == workload.passing,
+            "compare:fail": lambda: merged == workload.failing,
+            "report:full": lambda: list(failed.report()),
+            "report:collapsed": lambda: list(failed.report(REPORT_CONTEXT)),
+        }
+    )
+    return result
+
+
+def run(
+    workloads: list[str], sizes: list[int], repeat: int
+) -> list[dict[str, Any]]:
+    results = []
+    for name in workloads:
+        for size in sizes:
+            workload = WORKLOADS[name](size, random.Random(size))
+            for case, function in cases(workload).items():
+                times = measure(function, repeat)
+                result = {
+                    "workload": name,
+                    "lines": size,
+                    "case": case,
+                    "seconds": min(times),
+                    "mean": statistics.mean(times),
+                }
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def key(result: dict[str, Any]) -> tuple[str, int, str]:
+    return result["workload"], result["lines"], result["case"]
+
+
+def print_result(result: dict[str, Any], baseline: float | None = None) -> None:
+    line = (
+        f"{result['workload']:>8} {result['lines']:>9} {result['case']:<18} "
+        f"{result['seconds']:>10.5f}"
+    )
+    if baseline is not None:
+        line += f" {baseline:>10.5f} {result['seconds'] / baseline:>7.2f}x"
+    print(line, flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, SIZES)),
+        help="comma separated numbers of lines (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workloads",
+        default=",".join(WORKLOADS),
+        help="comma separated workloads (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--output", type=pathlib.Path, help="write JSON")
+    parser.add_argument(
+        "--compare", type=pathlib.Path, help="compare with earlier JSON"
+    )
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    workloads = args.workloads.split(",")
+
+    print(f"{'workload':>8} {'lines':>9} {'case':<18} {'best (s)':>10}")
+    results = run(workloads, sizes, args.repeat)
+    if args.compare:
+        earlier = json.loads(args.compare.read_text())
+        baseline = {key(result): result for result in earlier["results"]}
+        print()
+        print(
+            f"{'workload':>8} {'lines':>9} {'case':<18} {'best (s)':>10} "
+            f"{earlier['version']:>10} {'ratio':>8}"
+        )
+        for result in results:
+            if key(result) in baseline:
+                print_result(result, baseline[key(result)]["seconds"])
+    if args.output:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "version": __version__,
+                    "python": platform.python_version(),
+                    "implementation": platform.python_implementation(),
+                    "machine": platform.machine(),
+                    "platform": sys.platform,
+                    "created": dt.datetime.now(dt.timezone.utc).isoformat(),
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
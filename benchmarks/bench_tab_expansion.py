@@ -0,0 +1,59 @@
+"""Tab expansion on a tab-heavy 50k line TSV dump.
+
+The former `tab_replace()` rescanned and copied the line for every tab and
+ran for every (expectation, line) pair. Tabs are now expanded in a single
+pass, once per line, when the audit is created.
+
+    $ python benchmarks/bench_tab_expansion.py
+"""
+from __future__ import annotations
+
+import random
+import time
+
+from pytest_patterns.plugin import PatternsLib, tab_replace
+
+ROWS = 50_000
+COLUMNS = 12
+
+
+def legacy_tab_replace(line: str) -> str:
+    while (position := line.find("\t")) != -1:
+        fill = " " * (8 - (position % 8))
+        line = line.replace("\t", fill)
+    return line
+
+
+def make_tsv(rng: random.Random) -> list[str]:
+    return [
+        "\t".join(
+            str(rng.randint(0, 10 ** rng.randint(1, 6))) for _ in range(COLUMNS)
+        )
+        for _ in range(ROWS)
+    ]
+
+
+def bench(function, lines: list[str]) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        function(line)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    rng = random.Random(0)
+    lines = make_tsv(rng)
+    print(f"legacy tab_replace: {bench(legacy_tab_replace, lines):.3f}s")
+    print(f"tab_replace:        {bench(tab_replace, lines):.3f}s")
+
+    patterns = PatternsLib()
+    patterns.tsv.optional("\n".join(tab_replace(line) for line in lines[::50]))
+    patterns.tsv.optional("1...")
+    content = "\n".join(lines)
+    start = time.perf_counter()
+    patterns.tsv._audit(content)
+    print(f"audit:              {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
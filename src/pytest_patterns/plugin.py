@@ -1,28 +1,265 @@
 from __future__ import annotations
 
+import array
+import bisect
+import collections
+import concurrent.futures
+import copy
+import cProfile
 import enum
+import functools
+import hashlib
+import itertools
+import json
+import mmap
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+import pathlib
+import pstats
 import re
-from typing import Any, Iterator, List, Set, Tuple
+import sys
+import time
+import uuid
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Sequence,
+    TypeVar,
+    cast,
+    overload,
+)
 
 import pytest
 
 
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("patterns")
+    group.addoption(
+        "--patterns-report-dir",
+        metavar="DIR",
+        default=None,
+        help="Write failure reports of patterns to files in this directory "
+        "and only show a summary in assertion messages.",
+    )
+    group.addoption(
+        "--patterns-jsonl",
+        metavar="FILE",
+        default=None,
+        help="Append the audits of failed comparisons to this file as JSON "
+        "lines.",
+    )
+    group.addoption(
+        "--patterns-jsonl-passing",
+        action="store_true",
+        default=False,
+        help="Also export the audits of passing comparisons with "
+        "--patterns-jsonl.",
+    )
+    group.addoption(
+        "--patterns-timings",
+        metavar="N",
+        type=int,
+        default=None,
+        help="Measure the time, scanned lines and regular expression "
+        "evaluations of pattern ops and show the N slowest patterns and ops "
+        "(N=0 for all). Comparisons then always run complete audits.",
+    )
+    group.addoption(
+        "--patterns-profile",
+        metavar="FILE",
+        default=None,
+        help="Profile comparisons and audits of patterns (and nothing else) "
+        "and write the merged statistics to this file in pstats format.",
+    )
+    group.addoption(
+        "--patterns-profile-tests",
+        action="store_true",
+        default=False,
+        help="Also write the statistics of each test to a separate file with "
+        "--patterns-profile.",
+    )
+    parser.addini(
+        "patterns_keep_audit",
+        type="bool",
+        default=True,
+        help="Keep the last audit of a pattern to render failure reports "
+        "without auditing the content again. Disable to save memory.",
+    )
+    parser.addini(
+        "patterns_tabsize",
+        default=str(TAB_SIZE),
+        help="Expand tabs in tested content to this many columns.",
+    )
+    parser.addini(
+        "patterns_zero_copy",
+        type="bool",
+        default=False,
+        help="Do not split tested content into separate line strings up "
+        "front, but slice lines from it when needed. Lowers peak memory "
+        "for huge outputs at the expense of speed.",
+    )
+    parser.addini(
+        "patterns_report_context",
+        default="",
+        help="Only report this many lines around unexpected and refused "
+        "lines in failure reports and collapse other matched lines. Reports "
+        "are complete by default and with -vv.",
+    )
+    parser.addini(
+        "patterns_workers",
+        default="0",
+        help="Audit the ops of patterns on large content in parallel with "
+        "this many worker processes (threads on free-threaded Python).",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    if config.getoption("patterns_timings", None) is not None:
+        config.stash[TIMINGS_KEY] = PatternTimings()
+    profile = config.getoption("patterns_profile", None)
+    if profile:
+        config.stash[PROFILER_KEY] = AuditProfiler(
+            worker_path(config.invocation_params.dir / profile),
+            per_test=config.getoption("patterns_profile_tests"),
+        )
+    jsonl = config.getoption("patterns_jsonl", None)
+    if jsonl:
+        config.stash[EXPORTER_KEY] = AuditExporter(
+            worker_path(config.invocation_params.dir / jsonl),
+            passing=config.getoption("patterns_jsonl_passing"),
+        )
+
+
+def worker_path(path: pathlib.Path) -> pathlib.Path:
+    """Give each xdist worker its own file."""
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if not worker:
+        return path
+    return path.with_name(f"{path.stem}-{worker}{path.suffix}")
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    profiler = session.config.stash.get(PROFILER_KEY, None)
+    if profiler is not None:
+        profiler.write()
+
+
+def pytest_unconfigure() -> None:
+    while EXECUTORS:
+        _, pool = EXECUTORS.popitem()
+        pool.shutdown()
+
+
+def pytest_terminal_summary(
+    terminalreporter: pytest.TerminalReporter, config: pytest.Config
+) -> None:
+    profiler = config.stash.get(PROFILER_KEY, None)
+    if profiler is not None and profiler.profiles:
+        terminalreporter.write_line(
+            f"Profile of pattern audits written to {profiler.path}"
+        )
+    timings = config.stash.get(TIMINGS_KEY, None)
+    if timings is None:
+        return
+    terminalreporter.write_sep("=", "pattern timings")
+    for line in timings.report(config.getoption("patterns_timings")):
+        terminalreporter.write_line(line)
+
+
+def library_options(config: pytest.Config) -> dict[str, Any]:
+    return {
+        "keep_audit": config.getini("patterns_keep_audit"),
+        "tabsize": int(config.getini("patterns_tabsize")),
+        "zero_copy": config.getini("patterns_zero_copy"),
+        "exporter": config.stash.get(EXPORTER_KEY, None),
+        "timings": config.stash.get(TIMINGS_KEY, None),
+        "profiler": config.stash.get(PROFILER_KEY, None),
+        "workers": int(config.getini("patterns_workers")),
+    }
+
+
 @pytest.fixture
-def patterns() -> PatternsLib:
-    return PatternsLib()
+def patterns(pytestconfig: pytest.Config) -> PatternsLib:
+    return PatternsLib(**library_options(pytestconfig))
+
+
+@pytest.fixture(scope="session")
+def session_patterns(pytestconfig: pytest.Config) -> PatternsLib:
+    """A library for patterns shared by the whole session.
+
+    Define patterns in a session-scoped fixture and use `derive()` to extend
+    them per test.
+    """
+    return PatternsLib(**library_options(pytestconfig))
 
 
 def pytest_assertrepr_compare(
-    op: str, left: Any, right: Any
+    config: pytest.Config, op: str, left: Any, right: Any
 ) -> list[str] | None:
     if op != "==":
         return None
     if isinstance(left, Pattern):
-        return list(left._audit(right).report())
+        pattern, content = left, right
     elif isinstance(right, Pattern):
-        return list(right._audit(left).report())
+        pattern, content = right, left
     else:
         return None
+    audit = pattern._audit(content)
+    # The report is all we need from the audit.
+    pattern._last_audit = None
+    report_dir = config.getoption("patterns_report_dir", None)
+    if report_dir:
+        path = report_path(config.invocation_params.dir / report_dir)
+        audit.write_report(path)
+        return [*audit.summary(), "", f"The full report is in {path}"]
+    context = report_context(config)
+    report = list(audit.report(context))
+    if context is not None:
+        shown = sum(
+            end - start for start, end in audit.failing_sections(context)
+        )
+        if shown < len(audit.lines):
+            report.append("")
+            report.append("Matched lines were collapsed, use -vv to show all.")
+    return report
+
+
+def report_path(report_dir: pathlib.Path) -> pathlib.Path:
+    """Return a new file in the directory, named after the current test."""
+    name = file_name(current_test() or "report")
+    report_dir.mkdir(parents=True, exist_ok=True)
+    path = report_dir / f"{name}.txt"
+    # A test may report more than one comparison.
+    for i in itertools.count(2):
+        if not path.exists():
+            break
+        path = report_dir / f"{name}-{i}.txt"
+    return path
+
+
+def current_test() -> str | None:
+    """Return the node id of the running test, if any."""
+    test = os.environ.get("PYTEST_CURRENT_TEST")
+    if not test:
+        return None
+    return test.rsplit(" ", 1)[0]
+
+
+def file_name(test: str) -> str:
+    """Turn a node id into a safe file name."""
+    return re.sub(r"[^\w.-]+", "_", test).strip("_")
+
+
+def report_context(config: pytest.Config) -> int | None:
+    """Return the number of context lines for failure reports, or None for
+    complete reports."""
+    context = config.getini("patterns_report_context")
+    if not context or config.getoption("verbose") >= FULL_REPORT_VERBOSITY:
+        return None
+    return int(context)
 
 
 class Status(enum.Enum):
@@ -45,107 +282,774 @@ STATUS_SYMBOLS = {
 
 EMPTY_LINE_PATTERN = "<empty-line>"
 
-def tab_replace(line: str) -> str:
-    while (position := line.find("\t")) != -1:
-        fill = " " * (8 - (position % 8))
-        line = line.replace("\t", fill)
-    return line
+# The number of lines shown around failing lines when auditing streams.
+STREAM_CONTEXT = 5
 
+# Reports are always complete from this verbosity on (`-vv`).
+FULL_REPORT_VERBOSITY = 2
 
-def match(pattern: str, line: str) -> bool | re.Match[str] | None:
-    if pattern == EMPTY_LINE_PATTERN:
-        if not line:
-            return True
+# The number of failing lines and unmatched expectations in summaries.
+SUMMARY_LIMIT = 5
+
+TAB_SIZE = 8
+
+# Versions of patterns and generations of libraries.
+VERSIONS = itertools.count(1)
+
+# Compiled expectations are shared across the whole session. The size is
+# chosen to comfortably hold large merged pattern libraries without relying
+# on the (much smaller) internal cache of the `re` module.
+EXPECTATION_CACHE_SIZE = 4096
+
+# Limit how deeply the prefix tree of an expectation group is nested when
+# turned into a regular expression, as the `re` parser recurses per group.
+TRIE_MAX_NESTING = 20
+
+# Classifying all lines for an `in_order` op costs about as much as scanning
+# them for a few expectations (whose prefilters are cheaper than the
+# combined regular expression of the op), so it only pays off if more
+# expectations are left.
+CLASSIFY_MIN_EXPECTATIONS = 8
+
+# Content with fewer characters is always audited sequentially, as starting
+# parallel audits does not pay off.
+PARALLEL_MIN_SIZE = 2**20
+TRIE_END = ""
+
+
+def tab_replace(line: str, tabsize: int = TAB_SIZE) -> str:
+    """Expand tabs to spaces, aligned to tab stops as terminals render them."""
+    return line.expandtabs(tabsize)
+
+
+class Expectation:
+    """A single expectation line, compiled once and matched many times."""
+
+    pattern: str
+    literals: tuple[str, ...] | None
+    prefilter: str
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        chunks = pattern.split("...")
+        # Expectations without an ellipsis are compared by equality. Others
+        # only evaluate their regex for lines containing the longest fixed
+        # chunk.
+        if len(chunks) == 1:
+            self.literals = (pattern,)
+            if pattern == EMPTY_LINE_PATTERN:
+                self.literals += ("",)
+        else:
+            self.literals = None
+        self.prefilter = max(chunks, key=len)
+
+    def __repr__(self) -> str:
+        return f"<Expectation {self.pattern!r}>"
+
+    @functools.cached_property
+    def regex(self) -> re.Pattern[str]:
+        # Compiled on demand, as groups mostly match their combined regex.
+        regex = re.escape(self.pattern).replace(r"\.\.\.", ".*?")
+        if self.pattern == EMPTY_LINE_PATTERN:
+            # The marker matches literally as well as empty lines.
+            regex = "(?:" + regex + ")?"
+        return re.compile("^" + regex + "$")
+
+    def match(self, line: str) -> bool:
+        """Does the (tab-expanded) line match this expectation?"""
+        if self.literals is not None:
+            return line in self.literals
+        if self.prefilter not in line:
+            return False
+        return self.regex.match(line) is not None
+
+    def tokens(self) -> Iterator[list[str]]:
+        """Yield the regex tokens of every variant of this expectation."""
+        variants = [self.pattern]
+        if self.pattern == EMPTY_LINE_PATTERN:
+            variants.append("")
+        for variant in variants:
+            tokens = []
+            for i, chunk in enumerate(variant.split("...")):
+                if i:
+                    tokens.append(".*?")
+                tokens.extend(re.escape(char) for char in chunk)
+            yield tokens
 
-    line = tab_replace(line)
-    pattern = re.escape(pattern)
-    pattern = pattern.replace(r"\.\.\.", ".*?")
-    re_pattern = re.compile("^" + pattern + "$")
-    return re_pattern.match(line)
+
+class ExpectationGroup:
+    """The expectations of a single op, matched against a line at once."""
+
+    expectations: list[Expectation]
+    literals: dict[str, list[Expectation]]
+    wildcards: list[Expectation]
+
+    def __init__(self, expectations: list[Expectation]):
+        self.expectations = expectations
+        self.literals = {}
+        self.wildcards = []
+        for expectation in expectations:
+            if expectation.literals is None:
+                self.wildcards.append(expectation)
+                continue
+            for literal in expectation.literals:
+                self.literals.setdefault(literal, []).append(expectation)
+
+    def __iter__(self) -> Iterator[Expectation]:
+        return iter(self.expectations)
+
+    def __len__(self) -> int:
+        return len(self.expectations)
+
+    @functools.cached_property
+    def regex_source(self) -> str | None:
+        """The source of a combined regular expression for all wildcard
+        expectations."""
+        # Common prefixes are factored out, so matching a line against the
+        # whole group is a single regex evaluation.
+        if not self.wildcards:
+            return None
+        return "^" + expectations_regex(self.wildcards)
+
+    @functools.cached_property
+    def regex(self) -> re.Pattern[str] | None:
+        """A combined regular expression for all wildcard expectations."""
+        if self.regex_source is None:
+            return None
+        return re.compile(self.regex_source)
+
+    def match_wildcards(self, line: str) -> bool:
+        """Does any of the wildcard expectations match the line?"""
+        if self.regex is None:
+            return False
+        return self.regex.match(line) is not None
+
+    def matching_wildcards(self, line: str) -> list[Expectation]:
+        """Return all wildcard expectations matching the line."""
+        if not self.match_wildcards(line):
+            return []
+        return [e for e in self.wildcards if e.match(line)]
+
+    def match(self, line: str) -> bool:
+        """Does any of the expectations match the line?"""
+        return line in self.literals or self.match_wildcards(line)
+
+    def matching(self, line: str) -> list[Expectation]:
+        """Return all expectations matching the line."""
+        if not self.match(line):
+            return []
+        return [e for e in self.expectations if e.match(line)]
+
+
+def expectations_regex(expectations: Iterable[Expectation]) -> str:
+    """Return a regular expression matching a line (without the leading
+    `^`) if any of the expectations does."""
+    trie: dict[str, Any] = {}
+    for expectation in expectations:
+        for tokens in expectation.tokens():
+            node = trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[TRIE_END] = {}
+    return trie_regex(trie)
+
+
+def trie_regex(node: dict[str, Any], depth: int = 0) -> str:
+    alternatives = []
+    if depth >= TRIE_MAX_NESTING:
+        # Stop factoring and spell out all remaining suffixes.
+        stack = [("", node)]
+        while stack:
+            prefix, node = stack.pop()
+            for token, child in node.items():
+                if token == TRIE_END:
+                    alternatives.append(prefix + "$")
+                else:
+                    stack.append((prefix + token, child))
+    else:
+        for token, child in node.items():
+            if token == TRIE_END:
+                alternatives.append("$")
+                continue
+            chain = [token]
+            # Collapse runs without branches into a single literal chain.
+            tail = child
+            while len(tail) == 1 and TRIE_END not in tail:
+                ((next_token, tail),) = tail.items()
+                chain.append(next_token)
+            alternatives.append("".join(chain) + trie_regex(tail, depth + 1))
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
+
+
+@functools.lru_cache(maxsize=EXPECTATION_CACHE_SIZE)
+def compile_expectation(pattern: str) -> Expectation:
+    return Expectation(pattern)
+
+
+def match(pattern: str, line: str) -> bool:
+    return compile_expectation(pattern).match(tab_replace(line))
+
+
+STATUS_BY_VALUE = {status.value: status for status in Status}
+
+# The order of statuses in the legend of reports.
+STATUS_ORDER = [
+    Status.EXPECTED,
+    Status.OPTIONAL,
+    Status.UNEXPECTED,
+    Status.REFUSED,
+]
+
+# Finds the positions of lines with a failing status in `Audit.statuses`.
+FAILING_STATUSES = re.compile(
+    b"[%c%c]" % (Status.UNEXPECTED.value, Status.REFUSED.value)
+)
+
+# The line boundaries recognized by `str.splitlines()`.
+LINE_BREAKS = re.compile("\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+OTHER_LINE_BREAKS = "\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+class LineBuffer(Sequence[str]):
+    """The lines of a string, sliced from it only when they are accessed.
+
+    This behaves like `content.splitlines()`, but only keeps the offsets of
+    the lines instead of a copy of each of them.
+    """
+
+    content: Any
+    starts: array.array[int]
+    ends: array.array[int]
+    tabsize: int | None = None
+
+    def __init__(self, content: str):
+        self.content = content
+        self.split(LINE_BREAKS)
+
+    def split(self, line_breaks: re.Pattern[Any]) -> None:
+        self.starts = array.array("Q")
+        self.ends = array.array("Q")
+        start = 0
+        for line_break in line_breaks.finditer(self.content):
+            self.starts.append(start)
+            self.ends.append(line_break.start())
+            start = line_break.end()
+        if start < len(self.content):
+            self.starts.append(start)
+            self.ends.append(len(self.content))
+
+    def has_tabs(self) -> bool:
+        return "\t" in self.content
+
+    def text(self, start: int, end: int) -> str:
+        return self.content[start:end]  # type: ignore[no-any-return]
+
+    def expandtabs(self, tabsize: int) -> LineBuffer:
+        """Return a view on the same lines with tabs expanded."""
+        view = copy.copy(self)
+        view.tabsize = tabsize
+        return view
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @overload
+    def __getitem__(self, position: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, position: slice) -> list[str]:
+        ...
+
+    def __getitem__(self, position: int | slice) -> str | list[str]:
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        line = self.text(self.starts[position], self.ends[position])
+        if self.tabsize is not None:
+            line = tab_replace(line, self.tabsize)
+        return line
+
+    def __iter__(self) -> Iterator[str]:
+        text, tabsize = self.text, self.tabsize
+        for start, end in zip(self.starts, self.ends):
+            line = text(start, end)
+            yield line if tabsize is None else tab_replace(line, tabsize)
+
+    def close(self) -> None:
+        """Release the content. The lines can not be accessed afterwards."""
+
+
+class MappedLines(LineBuffer):
+    """The lines of a memory-mapped file, decoded only when accessed.
+
+    Lines are split at the encoded form of the line boundaries of
+    `str.splitlines()`, so the encoding must be ASCII compatible.
+    """
+
+    content: mmap.mmap | bytes
+
+    def __init__(self, path: str | os.PathLike[str], encoding: str = "utf-8"):
+        self.encoding = encoding
+        line_breaks = encoded_line_breaks(encoding)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # Empty files can not be mapped.
+                self.content = b""
+        self.split(line_breaks)
+
+    def has_tabs(self) -> bool:
+        return self.content.find(b"\t") != -1
+
+    def text(self, start: int, end: int) -> str:
+        return self.content[start:end].decode(self.encoding)
+
+    def close(self) -> None:
+        if isinstance(self.content, mmap.mmap):
+            self.content.close()
+
+
+@functools.lru_cache
+def encoded_line_breaks(encoding: str) -> re.Pattern[bytes]:
+    """Return a regular expression for the line boundaries of
+    `str.splitlines()` in the given encoding."""
+    if "\r\n".encode(encoding) != b"\r\n":
+        msg = (
+            f"Lines can only be split in ASCII compatible encodings, "
+            f"not {encoding!r}."
+        )
+        raise ValueError(msg)
+    alternatives = [b"\r\n"]
+    for line_break in "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029":
+        try:
+            alternatives.append(re.escape(line_break.encode(encoding)))
+        except UnicodeEncodeError:
+            continue
+    return re.compile(b"|".join(alternatives))
 
 
 class Line:
-    status: Status = Status.UNEXPECTED
-    status_cause: str = ""
+    """A view on a single line of an audit."""
 
-    def __init__(self, data: str):
-        self.data = data
+    __slots__ = ("audit", "position")
+
+    def __init__(self, audit: Audit, position: int):
+        self.audit = audit
+        self.position = position
+
+    @property
+    def data(self) -> str:
+        return self.audit.lines[self.position]
 
-    def matches(self, expectation: str) -> bool:
-        return bool(match(expectation, self.data))
+    @property
+    def status(self) -> Status:
+        return STATUS_BY_VALUE[self.audit.statuses[self.position]]
+
+    @property
+    def status_cause(self) -> str:
+        return self.audit.causes[self.audit.cause_ids[self.position]]
 
     def mark(self, status: Status, cause: str) -> None:
-        if status.value <= self.status.value:
-            # Stay in the current status
-            return
-        self.status = status
-        self.status_cause = cause
+        self.audit.mark([self.position], status, cause)
 
 
 class Audit:
-    content: list[Line]
+    """The result of matching content against the ops of a pattern."""
+
+    lines: Sequence[str]
+    normalized: Sequence[str]
+    statuses: bytearray
+    cause_ids: array.array[int]
+    causes: list[str]
     unmatched_expectations: list[tuple[str, str]]
     matched_refused: set[tuple[str, str]]
 
-    def __init__(self, content: str):
+    def __init__(
+        self,
+        content: str | LineBuffer,
+        tabsize: int = TAB_SIZE,
+        *,
+        zero_copy: bool = False,
+    ):
         self.unmatched_expectations = []
         self.matched_refused = set()
+        # The duration of each op, in seconds.
+        self.timings: list[tuple[str, str, float]] = []
+        if isinstance(content, LineBuffer):
+            zero_copy = True
+        self.zero_copy = zero_copy
+        self.tabsize = tabsize
+
+        if zero_copy:
+            # Keep the content as it is and slice lines whenever needed.
+            if isinstance(content, LineBuffer):
+                self.lines = content
+            else:
+                self.lines = LineBuffer(content)
+            if self.lines.has_tabs():
+                self.normalized = self.lines.expandtabs(tabsize)
+            else:
+                self.normalized = self.lines
+        else:
+            assert isinstance(content, str)
+            self.lines = content.splitlines()
+            # Matching only ever looks at the normalized (tab-expanded) text
+            # of each line, which is computed once here. The original lines
+            # are kept for the report.
+            if "\t" in content:
+                self.normalized = [
+                    tab_replace(line, tabsize) for line in self.lines
+                ]
+            else:
+                self.normalized = self.lines
+        self.statuses = bytearray([Status.UNEXPECTED.value]) * len(self.lines)
+        self.cause_ids = array.array("H", [0]) * len(self.lines)
+        self.causes = [""]
+        self._cause_ids = {"": 0}
+        # The positions of all lines matching an expectation, see classify().
+        self.positions: dict[Expectation, array.array[int]] = {}
+
+    def run(self, ops: Iterable[tuple[str, str, ExpectationGroup]]) -> None:
+        """Apply the ops to the content and measure how long each takes."""
+        for op, name, expectations in ops:
+            start = time.perf_counter()
+            getattr(self, op)(name, expectations)
+            self.timings.append((op, name, time.perf_counter() - start))
+
+    def run_parallel(
+        self,
+        content: str,
+        ops: Iterable[tuple[str, str, ExpectationGroup]],
+        pool: concurrent.futures.Executor,
+        chunks: int = 1,
+    ) -> None:
+        """Apply the optional and refused ops to chunks of the content in
+        parallel and the other ops here, with the same result as `run()`."""
+        shared = None
+        source: str | SharedContent = content
+        if isinstance(pool, concurrent.futures.ProcessPoolExecutor):
+            source = shared = SharedContent(content)
+        try:
+            if shared is not None:
+                spans = shared.spans(chunks)
+            else:
+                spans = line_spans(content, chunks, LINE_BREAKS)
+            options = (self.tabsize, self.zero_copy)
+            # Optional and refused ops do not depend on other lines, so their
+            # chunks are audited by workers. The other ops need the whole
+            # content, which is cheaper to search here than to read, decode
+            # and split again in a worker.
+            tasks = [
+                (
+                    op,
+                    name,
+                    group,
+                    [
+                        pool.submit(
+                            audit_op, source, span, options, (op, name, group)
+                        )
+                        for span in spans
+                    ]
+                    if op in ("optional", "refused")
+                    else [],
+                )
+                for op, name, group in ops
+            ]
+            # Ops only raise the status of lines, but the first op to do so
+            # is the cause, so the results are applied in the order of ops.
+            for op, name, group, parts in tasks:
+                if not parts:
+                    self.run([(op, name, group)])
+                    continue
+                statuses = []
+                seconds = 0.0
+                for part in parts:
+                    result = part.result()
+                    statuses.append(result[0])
+                    self.unmatched_expectations.extend(result[1])
+                    self.matched_refused.update(result[2])
+                    seconds += result[3]
+                self.merge(name, b"".join(statuses))
+                self.timings.append((op, name, seconds))
+        finally:
+            if shared is not None:
+                shared.close()
 
-        self.content = []
-        for line in content.splitlines():
-            self.content.append(Line(line))
+    def merge(self, cause: str, statuses: bytes) -> None:
+        """Mark lines with the statuses of another audit of the content."""
+        for status in STATUS_ORDER:
+            if status is Status.UNEXPECTED:
+                continue
+            marked = re.finditer(re.escape(bytes([status.value])), statuses)
+            self.mark((match.start() for match in marked), status, cause)
 
-    def cursor(self) -> Iterator[Line]:
-        return iter(self.content)
+    @property
+    def content(self) -> list[Line]:
+        """Views on all lines, mainly for reporting and tests."""
+        return [Line(self, position) for position in range(len(self.lines))]
+
+    def mark(
+        self, positions: Iterable[int], status: Status, cause: str
+    ) -> None:
+        """Raise the status of the lines at the given positions.
+
+        Lines keep their current status (and cause) if it is at least as
+        strong as the new one.
+        """
+        value = status.value
+        statuses, cause_ids = self.statuses, self.cause_ids
+        cause_id = None
+        for position in positions:
+            if statuses[position] < value:
+                if cause_id is None:
+                    cause_id = self.cause_id(cause)
+                statuses[position] = value
+                cause_ids[position] = cause_id
+
+    def cause_id(self, cause: str) -> int:
+        """Return the index of the cause in the table of causes."""
+        if (cause_id := self._cause_ids.get(cause)) is None:
+            cause_id = self._cause_ids[cause] = len(self.causes)
+            self.causes.append(cause)
+        return cause_id
+
+    @functools.cached_property
+    def index(self) -> dict[str, list[int]]:
+        """Map the normalized text of each line to its positions.
+
+        Zero-copy audits do not use the index as it would hold a copy of
+        every distinct line.
+        """
+        index: dict[str, list[int]] = {}
+        for position, line in enumerate(self.normalized):
+            index.setdefault(line, []).append(position)
+        return index
+
+    def cursor(self, start: int = 0) -> Iterator[tuple[int, str]]:
+        """Iterate over the positions and normalized text of all lines
+        starting at `start`."""
+        if not start:
+            return enumerate(self.normalized)
+        normalized = self.normalized
+        return (
+            (position, normalized[position])
+            for position in range(start, len(normalized))
+        )
 
-    def in_order(self, name: str, expected_lines: list[str]) -> None:
+    def classify(self, group: ExpectationGroup) -> None:
+        """Find the positions of all lines matching the expectations of the
+        group in a single pass, for `find()` to bisect."""
+        # Repeated lines of a group are the same expectation. Literal
+        # expectations are looked up in the index, unless this is a
+        # zero-copy audit.
+        positions = {
+            expectation: array.array("Q")
+            for expectation in (
+                group.expectations if self.zero_copy else group.wildcards
+            )
+            if expectation not in self.positions
+        }
+        if not positions:
+            return
+        wildcards = [
+            e for e in dict.fromkeys(group.wildcards) if e in positions
+        ]
+        literals = {}
+        if self.zero_copy:
+            for literal, expectations in group.literals.items():
+                literals[literal] = [
+                    e for e in dict.fromkeys(expectations) if e in positions
+                ]
+        for position, line in self.cursor():
+            for expectation in literals.get(line, ()):
+                positions[expectation].append(position)
+            if wildcards and group.match_wildcards(line):
+                for expectation in wildcards:
+                    if expectation.match(line):
+                        positions[expectation].append(position)
+        self.positions.update(positions)
+
+    def rescan(self, group: ExpectationGroup, remaining: int) -> None:
+        """Prepare to search the remaining expectations of the group from
+        the start of the content again."""
+        # Instead of scanning all lines again for each of many expectations,
+        # classify them once.
+        if remaining >= CLASSIFY_MIN_EXPECTATIONS:
+            self.classify(group)
+
+    def occurrences(self, expectation: Expectation) -> Sequence[int]:
+        """Return the positions of all lines matching the expectation, after
+        its group was classified."""
+        if expectation in self.positions:
+            return self.positions[expectation]
+        assert expectation.literals is not None
+        found = [
+            self.index.get(literal, []) for literal in expectation.literals
+        ]
+        if len(found) == 1:
+            return found[0]
+        return sorted(itertools.chain.from_iterable(found))
+
+    def find(self, expectation: Expectation, start: int = 0) -> int | None:
+        """Return the position of the first line at or after `start` that
+        matches the expectation."""
+        matches = self.positions.get(expectation)
+        if matches is not None:
+            i = bisect.bisect_left(matches, start)
+            return matches[i] if i < len(matches) else None
+        if expectation.literals is not None and not self.zero_copy:
+            found = None
+            for literal in expectation.literals:
+                positions = self.index.get(literal, [])
+                i = bisect.bisect_left(positions, start)
+                if i < len(positions) and (
+                    found is None or positions[i] < found
+                ):
+                    found = positions[i]
+            return found
+        for position, line in self.cursor(start):
+            if expectation.match(line):
+                return position
+        return None
+
+    def in_order(self, name: str, expected_lines: ExpectationGroup) -> None:
         """Expect all lines exist and come in order, but they
         may be interleaved with other lines."""
-        cursor = self.cursor()
+        start = 0
         have_some_match = False
-        for expected_line in expected_lines:
-            for line in cursor:
-                if line.matches(expected_line):
-                    line.mark(Status.EXPECTED, name)
-                    have_some_match = True
-                    break
+        for i, expected_line in enumerate(expected_lines):
+            position = self.find(expected_line, start)
+            if position is not None:
+                self.mark([position], Status.EXPECTED, name)
+                have_some_match = True
+                start = position + 1
+                continue
+            self.unmatched_expectations.append((name, expected_line.pattern))
+            if not have_some_match:
+                # Reset the scan, if we didn't have any previous
+                # match - maybe a later line will produce a partial match.
+                self.rescan(expected_lines, len(expected_lines) - i - 1)
+                start = 0
             else:
-                self.unmatched_expectations.append((name, expected_line))
-                if not have_some_match:
-                    # Reset the scan, if we didn't have any previous
-                    # match - maybe a later line will produce a partial match.
-                    # But do not reset if we already have something matching,
-                    # because that would defeat the "in order" assumption.
-                    cursor = self.cursor()
-
-    def optional(self, name: str, tolerated_lines: list[str]) -> None:
+                # But do not reset if we already have something matching,
+                # because that would defeat the "in order" assumption.
+                start = len(self.lines)
+
+    def in_order_longest(
+        self, name: str, expected_lines: ExpectationGroup
+    ) -> None:
+        """Like `in_order`, but match as many expectations as possible instead
+        of the first line matching each one."""
+        self.classify(expected_lines)
+        # The longest common subsequence of expectations and lines, computed
+        # from the positions of matching lines (Hunt-Szymanski), so it takes
+        # time in proportion to those instead of expectations x lines.
+        # The smallest position that ends a match of k + 1 expectations, and
+        # the chain of (expectation, position) ending there.
+        thresholds: list[int] = []
+        chains: list[tuple[int, int, Any]] = []
+        for index, expectation in enumerate(expected_lines):
+            positions = self.occurrences(expectation)
+            # From the last position backwards, so a line never extends a
+            # match of the same expectation. Of all positions between two
+            # thresholds only the first one matters: jump to it directly,
+            # so an expectation matching many lines costs at most one step
+            # per threshold.
+            end = len(positions)
+            while end:
+                k = bisect.bisect_left(thresholds, positions[end - 1])
+                end = bisect.bisect_right(
+                    positions, thresholds[k - 1] if k else -1, 0, end
+                )
+                position = positions[end]
+                chain = (index, position, chains[k - 1] if k else None)
+                if k == len(thresholds):
+                    thresholds.append(position)
+                    chains.append(chain)
+                elif position < thresholds[k]:
+                    thresholds[k] = position
+                    chains[k] = chain
+        matched = {}
+        node = chains[-1] if chains else None
+        while node is not None:
+            index, position, node = node
+            matched[index] = position
+        self.mark(sorted(matched.values()), Status.EXPECTED, name)
+        self.unmatched_expectations.extend(
+            (name, expectation.pattern)
+            for index, expectation in enumerate(expected_lines)
+            if index not in matched
+        )
+
+    def optional(self, name: str, tolerated_lines: ExpectationGroup) -> None:
         """Those lines may exist and then they may appear anywhere
         a number of times, or they may not exist.
         """
-        for tolerated_line in tolerated_lines:
-            for line in self.cursor():
-                if line.matches(tolerated_line):
-                    line.mark(Status.OPTIONAL, name)
-
-    def refused(self, name: str, refused_lines: list[str]) -> None:
-        for refused_line in refused_lines:
-            for line in self.cursor():
-                if line.matches(refused_line):
-                    line.mark(Status.REFUSED, name)
-                    self.matched_refused.add((name, refused_line))
-
-    def continuous(self, name: str, continuous_lines: list[str]) -> None:
+        if self.zero_copy:
+            self.mark(
+                (
+                    position
+                    for position, line in self.cursor()
+                    if tolerated_lines.match(line)
+                ),
+                Status.OPTIONAL,
+                name,
+            )
+            return
+        for literal in tolerated_lines.literals:
+            self.mark(self.index.get(literal, []), Status.OPTIONAL, name)
+        if not tolerated_lines.wildcards:
+            return
+        self.mark(
+            (
+                position
+                for position, line in self.cursor()
+                if tolerated_lines.match_wildcards(line)
+            ),
+            Status.OPTIONAL,
+            name,
+        )
+
+    def refused(self, name: str, refused_lines: ExpectationGroup) -> None:
+        if self.zero_copy:
+            for position, line in self.cursor():
+                for refused_line in refused_lines.matching(line):
+                    self.mark([position], Status.REFUSED, name)
+                    self.matched_refused.add((name, refused_line.pattern))
+            return
+        for literal, expectations in refused_lines.literals.items():
+            positions = self.index.get(literal, [])
+            if not positions:
+                continue
+            self.mark(positions, Status.REFUSED, name)
+            for refused_line in expectations:
+                self.matched_refused.add((name, refused_line.pattern))
+        if not refused_lines.wildcards:
+            return
+        for position, line in self.cursor():
+            for refused_line in refused_lines.matching_wildcards(line):
+                self.mark([position], Status.REFUSED, name)
+                self.matched_refused.add((name, refused_line.pattern))
+
+    def continuous(self, name: str, continuous_lines: ExpectationGroup) -> None:
         continuous_cursor = enumerate(continuous_lines)
         continuous_index, continuous_line = next(continuous_cursor)
-        for line in self.cursor():
-            if continuous_index and not line.data:
+        # Skip ahead to the first line matching the start of the pattern.
+        start = self.find(continuous_line)
+        if start is None:
+            start = len(self.lines)
+        for position, line in self.cursor(start):
+            if continuous_index and not line:
                 # Continuity still allows empty lines (after the first line) in
                 # between as we filter them out from the pattern to make those
                 # more readable.
-                line.mark(Status.OPTIONAL, name)
+                self.mark([position], Status.OPTIONAL, name)
                 continue
-            if line.matches(continuous_line):
-                line.mark(Status.EXPECTED, name)
+            if continuous_line.match(line):
+                self.mark([position], Status.EXPECTED, name)
                 try:
                     continuous_index, continuous_line = next(continuous_cursor)
                 except StopIteration:
@@ -154,84 +1058,1139 @@ class Audit:
             elif continuous_index:
                 # This is not the first focus line any more, it's not valid to
                 # not match
-                line.mark(Status.REFUSED, name)
-                self.unmatched_expectations.append((name, continuous_line))
+                self.mark([position], Status.REFUSED, name)
+                self.unmatched_expectations.append(
+                    (name, continuous_line.pattern)
+                )
                 self.unmatched_expectations.extend(
-                    [(name, line) for i, line in continuous_cursor]
+                    [(name, e.pattern) for i, e in continuous_cursor]
                 )
                 break
         else:
-            self.unmatched_expectations.append((name, continuous_line))
+            self.unmatched_expectations.append((name, continuous_line.pattern))
             self.unmatched_expectations.extend(
-                [(name, line) for i, line in continuous_cursor]
+                [(name, e.pattern) for i, e in continuous_cursor]
             )
 
-    def report(self) -> Iterator[str]:
+    def report(self, context: int | None = None) -> Iterator[str]:
+        """Yield the lines of the report.
+
+        With `context`, only UNEXPECTED and REFUSED lines and that many lines
+        around them are shown, other runs of lines are collapsed into
+        markers (see `failing_sections`).
+        """
+        yield from report_header()
+        symbols = {status.value: status.symbol for status in Status}
+        if context is None:
+            sections = [(0, len(self.lines))]
+        else:
+            sections = self.failing_sections(context)
+        shown = 0
+        for start, end in sections:
+            if start > shown:
+                yield format_skipped_lines(start - shown)
+            for position in range(start, end):
+                yield format_line_report(
+                    symbols[self.statuses[position]],
+                    self.causes[self.cause_ids[position]],
+                    self.lines[position],
+                )
+            shown = end
+        if shown < len(self.lines):
+            yield format_skipped_lines(len(self.lines) - shown)
+        yield from report_expectations(
+            self.unmatched_expectations, self.matched_refused
+        )
+
+    def summary(self, limit: int = SUMMARY_LIMIT) -> Iterator[str]:
+        """Yield a short report: the number of lines per status and the
+        first failing lines and unmatched expectations."""
         yield "String did not meet the expectations."
         yield ""
-        yield " | ".join(
-            [
-                Status.EXPECTED.symbol + "=EXPECTED",
-                Status.OPTIONAL.symbol + "=OPTIONAL",
-                Status.UNEXPECTED.symbol + "=UNEXPECTED",
-                Status.REFUSED.symbol + "=REFUSED/UNMATCHED",
-            ]
+        counts = {
+            status: self.statuses.count(status.value) for status in STATUS_ORDER
+        }
+        yield f"{len(self.lines)} lines were tested: " + ", ".join(
+            f"{count} {status.symbol}={status.name}"
+            for status, count in counts.items()
         )
-        yield ""
-        yield "Here is the string that was tested: "
-        yield ""
-        for line in self.content:
-            yield format_line_report(
-                line.status.symbol, line.status_cause, line.data
-            )
-        if self.unmatched_expectations:
+        failing = counts[Status.UNEXPECTED] + counts[Status.REFUSED]
+        if failing:
             yield ""
-            yield "These are the unmatched expected lines: "
+            yield (
+                f"These are the first {min(failing, limit)} of {failing} "
+                f"unexpected or refused lines (with line numbers): "
+            )
             yield ""
-            for name, line_str in self.unmatched_expectations:
-                yield format_line_report(Status.REFUSED.symbol, name, line_str)
-        if self.matched_refused:
+        for match in itertools.islice(
+            FAILING_STATUSES.finditer(self.statuses), limit
+        ):
+            position = match.start()
+            yield f"{position + 1:>6}: " + format_line_report(
+                STATUS_BY_VALUE[self.statuses[position]].symbol,
+                self.causes[self.cause_ids[position]],
+                self.lines[position],
+            )
+        unmatched = self.unmatched_expectations
+        if unmatched:
             yield ""
-            yield "These are the matched refused lines: "
+            yield (
+                f"These are the first {min(len(unmatched), limit)} of "
+                f"{len(unmatched)} unmatched expected lines: "
+            )
             yield ""
-            for name, line_str in self.matched_refused:
+            for name, line_str in unmatched[:limit]:
                 yield format_line_report(Status.REFUSED.symbol, name, line_str)
 
+    def records(self, audit_id: str) -> Iterator[dict[str, Any]]:
+        """Yield a record for every line, unmatched expectation and matched
+        refused line, to be exported as JSON."""
+        for position, (line, status, cause_id) in enumerate(
+            zip(self.lines, self.statuses, self.cause_ids)
+        ):
+            yield {
+                "record": "line",
+                "audit": audit_id,
+                "number": position + 1,
+                "status": STATUS_BY_VALUE[status].name,
+                "cause": self.causes[cause_id] or None,
+                "line": line,
+            }
+        for name, line_str in self.unmatched_expectations:
+            yield {
+                "record": "unmatched",
+                "audit": audit_id,
+                "cause": name,
+                "expectation": line_str,
+            }
+        for name, line_str in sorted(self.matched_refused):
+            yield {
+                "record": "refused",
+                "audit": audit_id,
+                "cause": name,
+                "expectation": line_str,
+            }
+
+    def failing_sections(self, context: int) -> list[tuple[int, int]]:
+        """Return the ranges of positions to report with the given amount of
+        context around UNEXPECTED and REFUSED lines."""
+        sections: list[tuple[int, int]] = []
+        size = len(self.lines)
+        for failing in FAILING_STATUSES.finditer(self.statuses):
+            start = max(failing.start() - context, 0)
+            end = min(failing.start() + context + 1, size)
+            # Single lines before, between and after sections are included,
+            # as a marker would not make the report any shorter.
+            if start <= 1:
+                start = 0
+            if end >= size - 1:
+                end = size
+            if sections and start <= sections[-1][1] + 1:
+                start = sections.pop()[0]
+            sections.append((start, end))
+        if size == 1:
+            return [(0, 1)]
+        return sections
+
+    def write_report(self, path: str | os.PathLike[str]) -> None:
+        """Write the complete report to a file."""
+        with open(path, "w", encoding="utf-8") as f:
+            for line in self.report():
+                f.write(line + "\n")
+
     def is_ok(self) -> bool:
         if self.unmatched_expectations:
             return False
-        for line in self.content:
-            if line.status not in [Status.EXPECTED, Status.OPTIONAL]:
+        return not (
+            self.statuses.count(Status.UNEXPECTED.value)
+            or self.statuses.count(Status.REFUSED.value)
+        )
+
+    def close(self) -> None:
+        """Release the content, e.g. the memory map of a file audit. The
+        report can not be created afterwards."""
+        if isinstance(self.lines, LineBuffer):
+            self.lines.close()
+
+    def __enter__(self) -> Audit:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class OpStats:
+    """The cost of running ops: their number, their duration in seconds,
+    the lines they scanned and the regular expressions they evaluated."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.lines = 0
+        self.evaluations = 0
+
+    def add(self, other: OpStats) -> None:
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.lines += other.lines
+        self.evaluations += other.evaluations
+
+
+class CountingRegex:
+    """Stands in for the regular expression of an expectation or a group
+    and counts its evaluations."""
+
+    def __init__(self, owner: Expectation | ExpectationGroup, stats: OpStats):
+        self.owner = owner
+        self.stats = stats
+
+    def match(self, line: str) -> re.Match[str] | None:
+        self.stats.evaluations += 1
+        regex = self.owner.regex
+        assert regex is not None
+        return regex.match(line)
+
+
+def instrument_group(
+    group: ExpectationGroup, stats: OpStats
+) -> ExpectationGroup:
+    """Return a copy of the group that counts its regex evaluations."""
+    copies = {}
+    for expectation in group:
+        instrumented = copy.copy(expectation)
+        if expectation.literals is None:
+            # Shadows the cached property, which stays lazy.
+            instrumented.__dict__["regex"] = CountingRegex(expectation, stats)
+        copies[id(expectation)] = instrumented
+    result = copy.copy(group)
+    result.expectations = [copies[id(e)] for e in group.expectations]
+    result.wildcards = [copies[id(e)] for e in group.wildcards]
+    result.literals = {
+        literal: [copies[id(e)] for e in expectations]
+        for literal, expectations in group.literals.items()
+    }
+    if group.regex_source is not None:
+        result.__dict__["regex"] = CountingRegex(group, stats)
+    return result
+
+
+class InstrumentedAudit(Audit):
+    """An audit that also counts the lines each op scans and the regular
+    expressions it evaluates."""
+
+    def __init__(
+        self,
+        content: str | LineBuffer,
+        tabsize: int = TAB_SIZE,
+        *,
+        zero_copy: bool = False,
+    ):
+        super().__init__(content, tabsize, zero_copy=zero_copy)
+        self.stats: list[tuple[str, str, OpStats]] = []
+        self._current = OpStats()
+
+    def run(self, ops: Iterable[tuple[str, str, ExpectationGroup]]) -> None:
+        for op, name, expectations in ops:
+            stats = self._current = OpStats()
+            stats.calls = 1
+            instrumented = instrument_group(expectations, stats)
+            start = time.perf_counter()
+            getattr(self, op)(name, instrumented)
+            stats.seconds = time.perf_counter() - start
+            self.timings.append((op, name, stats.seconds))
+            self.stats.append((op, name, stats))
+
+    def cursor(self, start: int = 0) -> Iterator[tuple[int, str]]:
+        stats = self._current
+        for item in super().cursor(start):
+            stats.lines += 1
+            yield item
+
+
+class PatternTimings:
+    """Collect the stats of instrumented audits across a session."""
+
+    def __init__(self) -> None:
+        self.ops: dict[tuple[str, str], OpStats] = {}
+
+    def add(self, audit: InstrumentedAudit) -> None:
+        for op, name, stats in audit.stats:
+            self.ops.setdefault((name, op), OpStats()).add(stats)
+
+    def patterns(self) -> dict[str, OpStats]:
+        """Sum up the stats of all ops of each pattern."""
+        patterns: dict[str, OpStats] = {}
+        for (name, _), stats in self.ops.items():
+            patterns.setdefault(name, OpStats()).add(stats)
+        return patterns
+
+    def report(self, limit: int = 0) -> Iterator[str]:
+        """Yield tables of the slowest patterns and ops, or all if `limit`
+        is 0."""
+        sections = [
+            ("pattern", self.patterns().items()),
+            (
+                "pattern / op",
+                [(f"{n} / {o}", s) for (n, o), s in self.ops.items()],
+            ),
+        ]
+        for i, (label, rows) in enumerate(sections):
+            if i:
+                yield ""
+            yield (
+                f"{'seconds':>10} {'ops':>7} {'lines':>11} "
+                f"{'regex evals':>11}  {label}"
+            )
+            ranked = sorted(rows, key=lambda row: row[1].seconds, reverse=True)
+            for name, stats in ranked[:limit] if limit else ranked:
+                yield (
+                    f"{stats.seconds:>10.4f} {stats.calls:>7} "
+                    f"{stats.lines:>11} {stats.evaluations:>11}  {name}"
+                )
+
+
+class SharedContent:
+    """Content in shared memory, for audits in worker processes.
+
+    Only the name of the shared memory block is sent to workers.
+    """
+
+    def __init__(self, content: str):
+        data = content.encode("utf-8", "surrogatepass")
+        self.size = len(data)
+        # Blocks can not be empty.
+        self.memory = multiprocessing.shared_memory.SharedMemory(
+            create=True, size=max(self.size, 1)
+        )
+        assert self.memory.buf is not None
+        self.memory.buf[: self.size] = data
+        self.name = self.memory.name
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"name": self.name, "size": self.size}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+
+    def spans(self, parts: int) -> list[tuple[int, int]]:
+        assert self.memory.buf is not None
+        data = self.memory.buf[: self.size]
+        try:
+            return line_spans(data, parts, encoded_line_breaks("utf-8"))
+        finally:
+            data.release()
+
+    def read(self, start: int, end: int) -> str:
+        memory = multiprocessing.shared_memory.SharedMemory(name=self.name)
+        try:
+            assert memory.buf is not None
+            data = bytes(memory.buf[start:end])
+        finally:
+            memory.close()
+        return data.decode("utf-8", "surrogatepass")
+
+    def close(self) -> None:
+        self.memory.close()
+        self.memory.unlink()
+
+
+def line_spans(
+    data: str | bytes | memoryview, parts: int, line_breaks: re.Pattern[Any]
+) -> list[tuple[int, int]]:
+    """Split the data into up to `parts` spans of similar size that only
+    contain whole lines."""
+    size = len(data)
+    spans = []
+    start = 0
+    for part in range(1, parts):
+        line_break = line_breaks.search(data, max(start, size * part // parts))
+        if line_break is None:
+            break
+        spans.append((start, line_break.end()))
+        start = line_break.end()
+    if start < size or not spans:
+        spans.append((start, size))
+    return spans
+
+
+def audit_op(
+    source: str | SharedContent,
+    span: tuple[int, int],
+    options: tuple[int, bool],
+    op: tuple[str, str, ExpectationGroup],
+) -> tuple[bytes, list[tuple[str, str]], set[tuple[str, str]], float]:
+    """Apply a single op to a span of the content in a worker and return
+    its marks."""
+    if isinstance(source, str):
+        content = source[span[0] : span[1]]
+    else:
+        content = source.read(*span)
+    start = time.perf_counter()
+    tabsize, zero_copy = options
+    result = Audit(content, tabsize, zero_copy=zero_copy)
+    kind, name, group = op
+    getattr(result, kind)(name, group)
+    return (
+        bytes(result.statuses),
+        result.unmatched_expectations,
+        result.matched_refused,
+        time.perf_counter() - start,
+    )
+
+
+# Pools of parallel audits by their number of workers.
+EXECUTORS: dict[int, concurrent.futures.Executor] = {}
+
+
+def executor(workers: int) -> concurrent.futures.Executor:
+    """Return a pool with the given number of workers.
+
+    Threads only run in parallel if Python is built without the GIL,
+    otherwise the workers are processes.
+    """
+    if workers not in EXECUTORS:
+        if getattr(sys, "_is_gil_enabled", lambda: True)():
+            EXECUTORS[workers] = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            EXECUTORS[workers] = concurrent.futures.ThreadPoolExecutor(workers)
+    return EXECUTORS[workers]
+
+
+class Verdict(Audit):
+    """Decide whether content meets the expectations, without reporting.
+
+    The checks stop at the first unmatched expectation or the first line
+    that is refused or neither expected nor tolerated.
+    """
+
+    def __init__(
+        self,
+        content: str | LineBuffer,
+        tabsize: int = TAB_SIZE,
+        *,
+        zero_copy: bool = False,
+    ):
+        super().__init__(content, tabsize, zero_copy=zero_copy)
+        # The positions of all lines marked as expected (or tolerated by a
+        # continuous op).
+        self.covered: set[int] = set()
+        # The normalized content as a single string, to skip runs of allowed
+        # lines with a single regex match. Only if it splits into lines like
+        # `str.splitlines()` would.
+        self.text: str | None = None
+        if isinstance(content, str) and not any(
+            line_break in content for line_break in OTHER_LINE_BREAKS
+        ):
+            self.text = content
+            if "\t" in content:
+                self.text = content.expandtabs(tabsize)
+        # The offsets of lines in the text, where searches may start.
+        self.offsets = {0: 0} if self.text is not None else {}
+        # The position and offset of the line last looked up.
+        self.counted = (0, 0)
+
+    def mark(
+        self,
+        positions: Iterable[int],
+        status: Status,
+        cause: str,  # noqa: ARG002
+    ) -> None:
+        if status is Status.REFUSED:
+            # Continuous ops only refuse lines when an expectation is
+            # unmatched, which decides the verdict anyway.
+            return
+        self.covered.update(positions)
+
+    def is_ok(self) -> bool:
+        msg = "Use decide() to get the verdict."
+        raise TypeError(msg)
+
+    def rescan(self, group: ExpectationGroup, remaining: int) -> None:
+        # The verdict is decided at the first unmatched expectation, so
+        # there is nothing left to search.
+        pass
+
+    def find(self, expectation: Expectation, start: int = 0) -> int | None:
+        if self.unmatched_expectations:
+            # The verdict is decided, do not search any further.
+            return None
+        offset = self.offsets.get(start)
+        if offset is None or not searchable(expectation):
+            for position, line in self.cursor(start):
+                if expectation.match(line):
+                    return position
+            return None
+        for line_start, line_end in self.lines_containing(
+            expectation.prefilter, offset
+        ):
+            assert self.text is not None
+            if expectation.match(self.text[line_start:line_end]):
+                position = self.line_at(line_start)
+                self.offsets[position + 1] = line_end + 1
+                return position
+        return None
+
+    def decide(self, plan: Plan) -> bool:
+        if self.text is not None and self.any_line_refused(plan.refused):
+            return False
+        for op, name, expectations in plan.ops:
+            if op in ("in_order", "in_order_longest", "continuous"):
+                getattr(self, op)(name, expectations)
+                if self.unmatched_expectations:
+                    return False
+        return self.all_lines_allowed(plan)
+
+    def lines_containing(
+        self, needle: str, offset: int = 0
+    ) -> Iterator[tuple[int, int]]:
+        """Yield the start and end offsets of all lines of the text that
+        contain the needle, from the line starting at `offset` on."""
+        assert self.text is not None
+        text = self.text
+        found = text.find(needle, offset)
+        while found >= 0:
+            line_end = text.find("\n", found)
+            if line_end < 0:
+                line_end = len(text)
+            yield text.rfind("\n", 0, found) + 1, line_end
+            found = text.find(needle, line_end)
+
+    def line_at(self, offset: int) -> int:
+        """Return the position of the line starting at the offset."""
+        assert self.text is not None
+        line, counted = self.counted
+        if offset < counted:
+            line, counted = 0, 0
+        line += self.text.count("\n", counted, offset)
+        self.counted = line, offset
+        return line
+
+    def any_line_refused(self, refused: ExpectationGroup) -> bool:
+        """Does any line match a refused expectation?"""
+        assert self.text is not None
+        for expectation in refused:
+            if not searchable(expectation):
+                return any(refused.match(line) for line in self.normalized)
+            for line_start, line_end in self.lines_containing(
+                expectation.prefilter
+            ):
+                if expectation.match(self.text[line_start:line_end]):
+                    return True
+        return False
+
+    def all_lines_allowed(self, plan: Plan) -> bool:
+        """Is every line expected or tolerated, and none refused?"""
+        covered = self.covered
+        if self.text is None:
+            refused, tolerated = plan.refused, plan.tolerated
+            return not any(
+                refused.match(line)
+                or (position not in covered and not tolerated.match(line))
+                for position, line in self.cursor()
+            )
+        text, skip = self.text, plan.tolerated_lines.match
+        offset = 0
+        while True:
+            # Matches at least the empty string.
+            match = skip(text, offset)
+            assert match is not None
+            offset = match.end()
+            if offset >= len(text):
+                return True
+            # The line at the offset is not tolerated.
+            if self.line_at(offset) not in covered:
                 return False
-        return True
+            offset = text.find("\n", offset) + 1 or len(text)
+
+
+def searchable(expectation: Expectation) -> bool:
+    """Can lines matching the expectation be found by its prefilter?"""
+    return bool(expectation.prefilter) and "" not in (
+        expectation.literals or ()
+    )
+
+
+class StreamLine:
+    """A line of a stream audit that has not been reported yet."""
+
+    __slots__ = ("data", "holds", "marks")
+
+    def __init__(self, data: str):
+        self.data = data
+        # (status value, op index, cause) of every op that marked the line.
+        self.marks: list[tuple[int, int, str]] = []
+        # The number of marks that may still be withdrawn.
+        self.holds = 0
+
+    def resolve(self) -> tuple[Status, str]:
+        """Return the status and cause the line ends up with.
+
+        Like `Audit.mark`, the strongest status wins and among equally
+        strong marks the one from the earliest op.
+        """
+        marks = self.marks
+        if not marks:
+            return Status.UNEXPECTED, ""
+        if len(marks) == 1:
+            value, _, cause = marks[0]
+        else:
+            value, _, cause = max(marks, key=lambda m: (m[0], -m[1]))
+        return STATUS_BY_VALUE[value], cause
+
+
+class SettledLines:
+    """Consecutive lines of a stream audit that are neither UNEXPECTED nor
+    REFUSED, waiting behind a held line to be reported."""
+
+    __slots__ = ("context", "first_skipped", "head", "skipped", "tail")
+
+    def __init__(self, context: int):
+        self.context = context
+        self.head: list[tuple[Status, str, str]] = []
+        self.skipped = 0
+        self.first_skipped: tuple[Status, str, str] | None = None
+        self.tail: collections.deque[
+            tuple[Status, str, str]
+        ] = collections.deque(maxlen=context)
+
+    def append(self, line: tuple[Status, str, str]) -> None:
+        # Only the first and the last `context` lines can be reported, the
+        # lines in between are just counted.
+        if len(self.head) < self.context:
+            self.head.append(line)
+            return
+        if len(self.tail) == self.context:
+            if not self.skipped:
+                self.first_skipped = self.tail[0] if self.tail else line
+            self.skipped += 1
+        self.tail.append(line)
+
+
+class InOrderState:
+    """The progress of an `in_order` op in a stream audit."""
+
+    def __init__(self) -> None:
+        self.start: int | None = None
+        self.next = 0
+        self.lines: list[StreamLine] = []
+
+
+class StreamAudit:
+    """Audit lines as they arrive, with the same result as `Audit`. Only lines
+    within `context` lines of UNEXPECTED or REFUSED ones are kept for the
+    report, or all of them with `context=None`."""
+
+    def __init__(
+        self,
+        ops: Iterable[tuple[str, str, ExpectationGroup]],
+        tabsize: int = TAB_SIZE,
+        context: int | None = STREAM_CONTEXT,
+    ):
+        self.tabsize = tabsize
+        self.context = context
+        self.counts = dict.fromkeys(Status, 0)
+        self.matched_refused: set[tuple[str, str]] = set()
+        self.unmatched_expectations: list[tuple[str, str]] = []
+        self.closed = False
+
+        self._steps = []
+        self._states: list[Any] = []
+        self._unmatched: list[list[tuple[str, str]]] = []
+        for index, (op, name, expectations) in enumerate(ops):
+            if op == "in_order_longest":
+                msg = (
+                    "Streams can not be audited with "
+                    "`in_order(..., longest=True)`."
+                )
+                raise ValueError(msg)
+            step = getattr(self, "_" + op)
+            self._steps.append((step, index, name, expectations))
+            self._states.append(InOrderState() if op == "in_order" else [0])
+            self._unmatched.append([])
+
+        # Held lines and the lines after them, in order. Lines matched by an
+        # `in_order` op before its first line was seen are held until the op
+        # is decided, the lines after them can only be reported afterwards.
+        self._queue: collections.deque[
+            StreamLine | tuple[Status, str, str] | SettledLines
+        ] = collections.deque()
+        self._report: list[str] = []
+        # Lines that will be reported if an UNEXPECTED or REFUSED line
+        # follows. They are only formatted once they are.
+        self._before: collections.deque[
+            tuple[Status, str, str]
+        ] = collections.deque(maxlen=context)
+        self._after = 0
+        self._skipped = 0
+        # The first collapsed line, reported instead of a marker if it is
+        # the only one.
+        self._first_skipped: tuple[Status, str, str] | None = None
+
+    def feed(self, line: str) -> None:
+        entry = StreamLine(line)
+        normalized = tab_replace(line, self.tabsize)
+        for step, index, name, expectations in self._steps:
+            step(index, name, expectations, normalized, entry)
+        # Restarting an in_order op may have released held lines.
+        self._flush()
+        if entry.holds:
+            self._queue.append(entry)
+            return
+        status, cause = entry.resolve()
+        self.counts[status] += 1
+        if self._queue:
+            self._settle(status, cause, line)
+        else:
+            self._finish(status, cause, line)
+
+    def close(self) -> None:
+        for (step, index, name, expectations), state in zip(
+            self._steps, self._states
+        ):
+            if isinstance(state, InOrderState):
+                if state.start is None:
+                    missing = list(expectations)
+                else:
+                    missing = [
+                        *expectations.expectations[: state.start],
+                        *expectations.expectations[state.next :],
+                    ]
+                    # The remaining matches stand.
+                    for line in state.lines:
+                        line.holds -= 1
+                self._unmatched[index].extend(
+                    (name, expectation.pattern) for expectation in missing
+                )
+            elif step == self._continuous and state[0] >= 0:
+                self._unmatched[index].extend(
+                    (name, expectation.pattern)
+                    for expectation in expectations.expectations[state[0] :]
+                )
+        for unmatched in self._unmatched:
+            self.unmatched_expectations.extend(unmatched)
+        self._flush()
+        for before in self._before:
+            self._skip(before)
+        self._before.clear()
+        self._collapse()
+        self.closed = True
+
+    # Ops
+
+    def _in_order(
+        self,
+        index: int,
+        name: str,
+        expected_lines: ExpectationGroup,
+        line: str,
+        entry: StreamLine,
+    ) -> None:
+        state: InOrderState = self._states[index]
+        expectations = expected_lines.expectations
+        mark = (Status.EXPECTED.value, index, name)
+        # The op starts at the first line matching the earliest expectation
+        # that appears at all. Until the very first expectation was seen, a
+        # line matching an earlier expectation restarts the op there and
+        # withdraws the previous matches.
+        if state.start != 0:
+            limit = len(expectations) if state.start is None else state.start
+            for start in range(limit):
+                if not expectations[start].match(line):
+                    continue
+                # An earlier expectation appeared: restart the op here.
+                for previous in state.lines:
+                    previous.marks.remove(mark)
+                    previous.holds -= 1
+                state.start, state.next, state.lines = start, start + 1, []
+                break
+            else:
+                start = -1
+            if start >= 0:
+                entry.marks.append(mark)
+                if start:
+                    entry.holds += 1
+                    state.lines.append(entry)
+                return
+        if state.start is None or state.next >= len(expectations):
+            return
+        if expectations[state.next].match(line):
+            state.next += 1
+            entry.marks.append(mark)
+            if state.start:
+                entry.holds += 1
+                state.lines.append(entry)
+
+    def _optional(
+        self,
+        index: int,
+        name: str,
+        tolerated_lines: ExpectationGroup,
+        line: str,
+        entry: StreamLine,
+    ) -> None:
+        if tolerated_lines.match(line):
+            entry.marks.append((Status.OPTIONAL.value, index, name))
+
+    def _refused(
+        self,
+        index: int,
+        name: str,
+        refused_lines: ExpectationGroup,
+        line: str,
+        entry: StreamLine,
+    ) -> None:
+        for refused_line in refused_lines.matching(line):
+            entry.marks.append((Status.REFUSED.value, index, name))
+            self.matched_refused.add((name, refused_line.pattern))
+
+    def _continuous(
+        self,
+        index: int,
+        name: str,
+        continuous_lines: ExpectationGroup,
+        line: str,
+        entry: StreamLine,
+    ) -> None:
+        # The state is the index of the next expected line, or -1 once the
+        # op is decided.
+        state = self._states[index]
+        position = state[0]
+        if position < 0:
+            return
+        expectations = continuous_lines.expectations
+        if position and not line:
+            entry.marks.append((Status.OPTIONAL.value, index, name))
+        elif expectations[position].match(line):
+            entry.marks.append((Status.EXPECTED.value, index, name))
+            state[0] = position + 1
+            if state[0] == len(expectations):
+                state[0] = -1
+        elif position:
+            entry.marks.append((Status.REFUSED.value, index, name))
+            self._unmatched[index].extend(
+                (name, expectation.pattern)
+                for expectation in expectations[position:]
+            )
+            state[0] = -1
+
+    # Reporting
+
+    def _settle(self, status: Status, cause: str, data: str) -> None:
+        """Queue a line with a final status behind held lines."""
+        line = (status, cause, data)
+        if self.context is None or status in (
+            Status.UNEXPECTED,
+            Status.REFUSED,
+        ):
+            self._queue.append(line)
+            return
+        last = self._queue[-1]
+        if not isinstance(last, SettledLines):
+            last = SettledLines(self.context)
+            self._queue.append(last)
+        last.append(line)
+
+    def _flush(self) -> None:
+        """Report the queued lines up to the first line still held."""
+        queue = self._queue
+        while queue:
+            first = queue[0]
+            if isinstance(first, StreamLine):
+                if first.holds:
+                    return
+                status, cause = first.resolve()
+                self.counts[status] += 1
+                self._finish(status, cause, first.data)
+            elif isinstance(first, SettledLines):
+                for line in first.head:
+                    self._finish(*line)
+                if first.skipped:
+                    # The lines in between and all lines before them that
+                    # are not reported yet are collapsed.
+                    for line in self._before:
+                        self._skip(line)
+                    self._before.clear()
+                    self._skip(first.first_skipped, first.skipped)
+                for line in first.tail:
+                    self._finish(*line)
+            else:
+                self._finish(*first)
+            queue.popleft()
+
+    def _finish(self, status: Status, cause: str, data: str) -> None:
+        """Report a line (or collapse it) once all lines before it are."""
+        if self.context is None:
+            self._report.append(format_line_report(status.symbol, cause, data))
+        elif status in (Status.UNEXPECTED, Status.REFUSED):
+            self._collapse()
+            self._report.extend(
+                format_line_report(s.symbol, c, d) for s, c, d in self._before
+            )
+            self._before.clear()
+            self._report.append(format_line_report(status.symbol, cause, data))
+            self._after = self.context
+        elif self._after:
+            self._report.append(format_line_report(status.symbol, cause, data))
+            self._after -= 1
+        else:
+            line = (status, cause, data)
+            if len(self._before) == self.context:
+                self._skip(self._before[0] if self._before else line)
+            self._before.append(line)
+
+    def _skip(
+        self, line: tuple[Status, str, str] | None, count: int = 1
+    ) -> None:
+        if not self._skipped:
+            self._first_skipped = line
+        self._skipped += count
+
+    def _collapse(self) -> None:
+        if self._skipped == 1 and self._first_skipped is not None:
+            # A marker would not make the report any shorter.
+            status, cause, data = self._first_skipped
+            self._report.append(format_line_report(status.symbol, cause, data))
+        elif self._skipped:
+            self._report.append(format_skipped_lines(self._skipped))
+        self._skipped = 0
+        self._first_skipped = None
+
+    def report(self) -> Iterator[str]:
+        yield from report_header()
+        yield from self._report
+        yield from report_expectations(
+            self.unmatched_expectations, self.matched_refused
+        )
+
+    def is_ok(self) -> bool:
+        assert self.closed, "The stream was not audited completely."
+        if self.unmatched_expectations:
+            return False
+        return not (
+            self.counts[Status.UNEXPECTED] or self.counts[Status.REFUSED]
+        )
+
+
+def report_header() -> Iterator[str]:
+    yield "String did not meet the expectations."
+    yield ""
+    yield " | ".join(
+        [
+            Status.EXPECTED.symbol + "=EXPECTED",
+            Status.OPTIONAL.symbol + "=OPTIONAL",
+            Status.UNEXPECTED.symbol + "=UNEXPECTED",
+            Status.REFUSED.symbol + "=REFUSED/UNMATCHED",
+        ]
+    )
+    yield ""
+    yield "Here is the string that was tested: "
+    yield ""
+
+
+def report_expectations(
+    unmatched_expectations: list[tuple[str, str]],
+    matched_refused: set[tuple[str, str]],
+) -> Iterator[str]:
+    if unmatched_expectations:
+        yield ""
+        yield "These are the unmatched expected lines: "
+        yield ""
+        for name, line_str in unmatched_expectations:
+            yield format_line_report(Status.REFUSED.symbol, name, line_str)
+    if matched_refused:
+        yield ""
+        yield "These are the matched refused lines: "
+        yield ""
+        for name, line_str in matched_refused:
+            yield format_line_report(Status.REFUSED.symbol, name, line_str)
 
 
 def format_line_report(symbol: str, cause: str, line: str) -> str:
     return symbol + " " + cause.ljust(15)[:15] + " | " + line
 
 
+def format_skipped_lines(count: int) -> str:
+    return f"... {count} matched line{'s' if count > 1 else ''} ..."
+
+
+def stream_lines(
+    lines: Iterable[str | bytes], encoding: str = "utf-8"
+) -> Iterator[str]:
+    """Split the items of an iterable (e.g. a file) into lines like
+    `str.splitlines()` would split the whole content."""
+    for item in lines:
+        text = item.decode(encoding) if isinstance(item, bytes) else item
+        if not text:
+            # An empty item (as opposed to a lone line break) from a list of
+            # lines without line breaks.
+            yield text
+            continue
+        yield from text.splitlines()
+
+
 def pattern_lines(lines: str) -> list[str]:
     # Remove leading whitespace, ignore empty lines.
     return list(filter(None, lines.splitlines()))
 
 
+def compile_expectations(lines: str) -> ExpectationGroup:
+    return ExpectationGroup(
+        [compile_expectation(line) for line in pattern_lines(lines)]
+    )
+
+
+class Plan:
+    """The ops of a pattern and all patterns it merges, flattened once."""
+
+    ops: list[tuple[str, str, ExpectationGroup]]
+    # The versions of the patterns involved, by name.
+    versions: dict[str, int]
+    generation: int
+
+    def __init__(self, pattern: Pattern):
+        self.ops = []
+        self.versions = {}
+        self.library = pattern.library
+        self.generation = self.library._generation
+        self.add(pattern, [])
+
+    def add(self, pattern: Pattern, path: list[str]) -> None:
+        if pattern.name in path:
+            cycle = " -> ".join(path[path.index(pattern.name) :])
+            msg = (
+                f"Pattern {pattern.name!r} merges itself: "
+                f"{cycle} -> {pattern.name}"
+            )
+            raise ValueError(msg)
+        if pattern.name in self.versions:
+            return
+        path.append(pattern.name)
+        for inherited_pattern in pattern.inherited:
+            self.add(self.library._lookup(inherited_pattern), path)
+        path.pop()
+        self.versions[pattern.name] = pattern._version
+        self.ops.extend(pattern.ops)
+
+    @functools.cached_property
+    def tolerated(self) -> ExpectationGroup:
+        """The expectations of all optional ops, combined to match a line
+        against all of them at once."""
+        groups = [
+            expectations for op, _, expectations in self.ops if op == "optional"
+        ]
+        if len(groups) == 1:
+            return groups[0]
+        return ExpectationGroup([e for group in groups for e in group])
+
+    @functools.cached_property
+    def refused(self) -> ExpectationGroup:
+        """The expectations of all refused ops, combined."""
+        return ExpectationGroup(
+            [
+                expectation
+                for op, _, expectations in self.ops
+                if op == "refused"
+                for expectation in expectations
+            ]
+        )
+
+    @functools.cached_property
+    def tolerated_lines(self) -> re.Pattern[str]:
+        """Match a run of tolerated lines, separated by "\\n"."""
+        if not len(self.tolerated):
+            return re.compile("")
+        line = expectations_regex(self.tolerated)
+        return re.compile(r"(?m)(?:(?:" + line + r")(?:\n|\Z))*")
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """A digest of the ops that is stable across processes."""
+        ops = [
+            [op, name, [expectation.pattern for expectation in expectations]]
+            for op, name, expectations in self.ops
+        ]
+        return hashlib.sha256(json.dumps(ops).encode("utf-8")).hexdigest()
+
+    def is_current(self, library: PatternsLib) -> bool:
+        if self.generation == library._generation:
+            return True
+        # Something changed in the library, but maybe not in this plan.
+        for name, version in self.versions.items():
+            pattern = library._resolve(name)
+            if pattern is None or pattern._version != version:
+                return False
+        self.generation = library._generation
+        return True
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def profiled(method: F) -> F:
+    """Run the method in the profiler of the pattern's library, if any."""
+
+    @functools.wraps(method)
+    def wrapper(self: Pattern, *args: Any, **kwargs: Any) -> Any:
+        profiler = self.library._profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        return profiler.call(method, self, *args, **kwargs)
+
+    return cast(F, wrapper)
+
+
 class Pattern:
     name: str
     library: PatternsLib
     ops: list[tuple[str, str, Any]]
-    inherited: set[str]
+    # The names of merged patterns, in the order they were merged.
+    inherited: dict[str, None]
+
+    # Changes whenever this pattern changes. Versions are unique across
+    # libraries, but shared with the pattern a derived pattern was copied
+    # from.
+    _version: int = 0
+    _plan: Plan | None = None
+
+    # The content, library generation and result of the last audit so that
+    # reporting a failed comparison does not need to audit again.
+    _last_audit: tuple[str, int, Audit] | None = None
 
     def __init__(self, library: PatternsLib, name: str):
         self.name = name
         self.library = library
         self.ops = []
-        self.inherited = set()
+        self.inherited = {}
+
+    def _changed(self) -> None:
+        if self.library._frozen:
+            msg = (
+                f"Can not change pattern {self.name!r} of a frozen library. "
+                f"Use `derive()` to extend it."
+            )
+            raise RuntimeError(msg)
+        self._version = next(VERSIONS)
+        self.library._changed()
+
+    def _derive(self, library: PatternsLib) -> Pattern:
+        """Copy this pattern into a derived library."""
+        pattern = Pattern(library, self.name)
+        pattern.ops = list(self.ops)
+        pattern.inherited = dict(self.inherited)
+        pattern._version = self._version
+        if self._plan is not None:
+            pattern._plan = copy.copy(self._plan)
+            pattern._plan.library = library
+        return pattern
 
     # Modifiers (Verbs)
 
     def merge(self, *base_patterns: str) -> None:
         """Merge rules from base_patterns (recursively) into this pattern."""
-        self.inherited.update(base_patterns)
+        self._changed()
+        self.inherited.update(dict.fromkeys(base_patterns))
 
     def normalize(self, mode: str) -> None:
         pass
@@ -240,40 +2199,300 @@ class Pattern:
 
     def continuous(self, lines: str) -> None:
         """These lines must appear once and they must be continuous."""
-        self.ops.append(("continuous", self.name, pattern_lines(lines)))
+        self._changed()
+        self.ops.append(("continuous", self.name, compile_expectations(lines)))
 
-    def in_order(self, lines: str) -> None:
-        """These lines must appear once and they must be in order."""
-        self.ops.append(("in_order", self.name, pattern_lines(lines)))
+    def in_order(self, lines: str, *, longest: bool = False) -> None:
+        """These lines must appear once and they must be in order. With
+        `longest`, as many lines as possible are matched."""
+        self._changed()
+        op = "in_order_longest" if longest else "in_order"
+        self.ops.append((op, self.name, compile_expectations(lines)))
 
     def optional(self, lines: str) -> None:
         """These lines are optional."""
-        self.ops.append(("optional", self.name, pattern_lines(lines)))
+        self._changed()
+        self.ops.append(("optional", self.name, compile_expectations(lines)))
 
     def refused(self, lines: str) -> None:
         """If those lines appear they are refused."""
-        self.ops.append(("refused", self.name, pattern_lines(lines)))
+        self._changed()
+        self.ops.append(("refused", self.name, compile_expectations(lines)))
 
     # Internal API
 
-    def flat_ops(self) -> Iterator[tuple[str, str, Any]]:
-        for inherited_pattern in self.inherited:
-            yield from getattr(self.library, inherited_pattern).flat_ops()
-        yield from self.ops
+    def plan(self) -> Plan:
+        if self._plan is None or not self._plan.is_current(self.library):
+            self._plan = Plan(self)
+        return self._plan
+
+    def flat_ops(self) -> list[tuple[str, str, ExpectationGroup]]:
+        return self.plan().ops
 
+    @profiled
     def _audit(self, content: str) -> Audit:
-        audit = Audit(content)
-        for op, *args in self.flat_ops():
-            getattr(audit, op)(*args)
+        generation = self.library._generation
+        if self._last_audit is not None:
+            last_content, last_generation, audit = self._last_audit
+            if last_content is content and last_generation == generation:
+                return audit
+        audit = self._run(content)
+        if self.library._keep_audit:
+            self._last_audit = (content, generation, audit)
         return audit
 
+    @profiled
+    def audit_file(
+        self, path: str | os.PathLike[str], encoding: str = "utf-8"
+    ) -> Audit:
+        """Audit the content of a file without reading it into memory. Close the
+        audit (or use it as a context manager) to release the file."""
+        return self._run(MappedLines(path, encoding))
+
+    def _run(self, content: str | LineBuffer) -> Audit:
+        timings = self.library._timings
+        audit_type = Audit if timings is None else InstrumentedAudit
+        audit = audit_type(
+            content, self.library._tabsize, zero_copy=self.library._zero_copy
+        )
+        if self._parallel(content) and audit_type is Audit:
+            assert isinstance(content, str)
+            workers = self.library._workers
+            audit.run_parallel(
+                content, self.flat_ops(), executor(workers), chunks=workers
+            )
+        else:
+            audit.run(self.flat_ops())
+        if isinstance(audit, InstrumentedAudit):
+            assert timings is not None
+            timings.add(audit)
+        return audit
+
+    def _parallel(self, content: object) -> bool:
+        """Is the content large enough to be audited in parallel?"""
+        return (
+            self.library._workers > 1
+            and isinstance(content, str)
+            and len(content) >= PARALLEL_MIN_SIZE
+        )
+
+    @profiled
+    def audit_stream(
+        self,
+        lines: Iterable[str | bytes],
+        context: int | None = STREAM_CONTEXT,
+        encoding: str = "utf-8",
+    ) -> StreamAudit:
+        """Audit lines from an iterable, e.g. a file or a process' output,
+        as they arrive without keeping all of them in memory.
+
+        Bytes are decoded using the given encoding.
+        """
+        audit = StreamAudit(self.flat_ops(), self.library._tabsize, context)
+        for line in stream_lines(lines, encoding):
+            audit.feed(line)
+        audit.close()
+        return audit
+
+    @profiled
     def __eq__(self, other: object) -> bool:
         assert isinstance(other, str)
-        audit = self._audit(other)
-        return audit.is_ok()
+        exporter = self.library._exporter
+        passing = exporter is not None and exporter.passing
+        if passing or self.library._timings is not None:
+            # Measure or export the complete audit.
+            audit = self._audit(other)
+            if exporter is not None and (passing or not audit.is_ok()):
+                exporter.export(self, audit)
+            return audit.is_ok()
+        # Only audit the content completely if the report is needed.
+        verdict = Verdict(
+            other, self.library._tabsize, zero_copy=self.library._zero_copy
+        )
+        result = verdict.decide(self.plan())
+        if not result and exporter is not None:
+            exporter.export(self, self._audit(other))
+        return result
+
+
+class AuditExporter:
+    """Append audits to a file as JSON lines, e.g. for dashboards."""
+
+    def __init__(self, path: pathlib.Path, *, passing: bool = False):
+        self.path = path
+        # Export passing audits, too.
+        self.passing = passing
+
+    def export(self, pattern: Pattern, audit: Audit) -> None:
+        audit_id = uuid.uuid4().hex
+        header = {
+            "record": "audit",
+            "audit": audit_id,
+            "test": current_test(),
+            "pattern": pattern.name,
+            "fingerprint": pattern.plan().fingerprint,
+            "ok": audit.is_ok(),
+            "lines": len(audit.lines),
+            "statuses": {
+                status.name: audit.statuses.count(status.value)
+                for status in STATUS_ORDER
+            },
+            "timings": [
+                {"op": op, "name": name, "seconds": seconds}
+                for op, name, seconds in audit.timings
+            ],
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in itertools.chain([header], audit.records(audit_id)):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class AuditProfiler:
+    """Profile comparisons and audits of patterns, and nothing else."""
+
+    def __init__(self, path: pathlib.Path, *, per_test: bool = False):
+        self.path = path
+        self.per_test = per_test
+        self.profiles: dict[str, cProfile.Profile] = {}
+        self._active = False
+
+    def call(
+        self, function: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> Any:
+        if self._active:
+            # Nested calls, e.g. an audit within a comparison, are profiled
+            # by the outermost one.
+            return function(*args, **kwargs)
+        test = current_test() or "session"
+        profile = self.profiles.get(test)
+        if profile is None:
+            profile = self.profiles[test] = cProfile.Profile()
+        self._active = True
+        profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._active = False
+
+    def write(self) -> None:
+        if not self.profiles:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        profiles = iter(self.profiles.values())
+        stats = pstats.Stats(next(profiles))
+        for profile in profiles:
+            stats.add(profile)
+        stats.dump_stats(self.path)
+        if not self.per_test:
+            return
+        tests_dir = self.path.with_name(f"{self.path.stem}-tests")
+        tests_dir.mkdir(exist_ok=True)
+        for test, profile in self.profiles.items():
+            profile.dump_stats(tests_dir / f"{file_name(test)}.pstats")
+
+
+EXPORTER_KEY = pytest.StashKey[AuditExporter]()
+PROFILER_KEY = pytest.StashKey[AuditProfiler]()
+TIMINGS_KEY = pytest.StashKey[PatternTimings]()
 
 
 class PatternsLib:
+    # Changes whenever any pattern of this library changes. Generations are
+    # unique across libraries.
+    _generation: int = 0
+    # The (frozen) library this one was derived from.
+    _base: PatternsLib | None = None
+    _frozen: bool = False
+
+    def __init__(
+        self,
+        *,
+        keep_audit: bool = True,
+        tabsize: int = TAB_SIZE,
+        zero_copy: bool = False,
+        exporter: AuditExporter | None = None,
+        timings: PatternTimings | None = None,
+        profiler: AuditProfiler | None = None,
+        workers: int = 0,
+    ):
+        self._keep_audit = keep_audit
+        self._tabsize = tabsize
+        self._zero_copy = zero_copy
+        self._exporter = exporter
+        # Collects the stats of instrumented audits.
+        self._timings = timings
+        self._profiler = profiler
+        # Audits large content in parallel with this many workers.
+        self._workers = workers
+
+    def _changed(self) -> None:
+        self._generation = next(VERSIONS)
+
+    def freeze(self) -> None:
+        """Compile all patterns and refuse any further changes.
+
+        Frozen libraries can be shared, e.g. by a session-scoped fixture,
+        and extended per test with `derive()`.
+        """
+        for pattern in list(self._patterns()):
+            for _, _, expectations in pattern.plan().ops:
+                # Compile the combined regular expressions up front.
+                expectations.regex  # noqa: B018
+        self._frozen = True
+
+    def derive(self) -> PatternsLib:
+        """Return a frozen library that starts with the patterns of this one.
+        Patterns are copied into it when they are accessed."""
+        if not self._frozen:
+            self.freeze()
+        library = PatternsLib(
+            keep_audit=self._keep_audit,
+            tabsize=self._tabsize,
+            zero_copy=self._zero_copy,
+            exporter=self._exporter,
+            timings=self._timings,
+            profiler=self._profiler,
+            workers=self._workers,
+        )
+        library._base = self
+        library._generation = next(VERSIONS)
+        return library
+
+    def _patterns(self) -> Iterator[Pattern]:
+        for value in self.__dict__.values():
+            if isinstance(value, Pattern):
+                yield value
+
+    def _resolve(self, name: str) -> Pattern | None:
+        """Return the pattern with the given name, from this library or the
+        one it was derived from, without creating or copying it."""
+        pattern = self.__dict__.get(name)
+        if isinstance(pattern, Pattern):
+            return pattern
+        if self._base is not None:
+            return self._base._resolve(name)
+        return None
+
+    def _lookup(self, name: str) -> Pattern:
+        """Return the pattern with the given name for reading."""
+        pattern = self._resolve(name)
+        if pattern is None:
+            pattern = getattr(self, name)
+        return pattern
+
     def __getattr__(self, name: str) -> Pattern:
-        res = self.__dict__[name] = Pattern(self, name)
+        base_pattern = self._base._resolve(name) if self._base else None
+        if self._frozen:
+            if base_pattern is None:
+                msg = f"The library is frozen and has no pattern {name!r}."
+                raise AttributeError(msg)
+            # Can only be read, so there is no need to copy it.
+            return base_pattern
+        if base_pattern is None:
+            res = Pattern(self, name)
+        else:
+            res = base_pattern._derive(self)
+        self.__dict__[name] = res
         return res
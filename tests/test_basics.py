@@ -1,6 +1,11 @@
 import pytest
 
-from pytest_patterns.plugin import PatternsLib
+from pytest_patterns.plugin import (
+    Expectation,
+    PatternsLib,
+    compile_expectation,
+    match,
+)
 
 GENERIC_HEADER = [
     "String did not meet the expectations.",
@@ -11,6 +16,7 @@ GENERIC_HEADER = [
     "",
 ]
 
+
 def test_tab_replace() -> None:
     from pytest_patterns.plugin import tab_replace
 
@@ -24,6 +30,49 @@ def test_tab_replace() -> None:
     assert tab_replace("1234567\t9") == "1234567 9"
     assert tab_replace("12345678\t9") == "12345678        9"
     assert tab_replace("123456789\t0") == "123456789       0"
+    # Every tab is aligned to the next tab stop on its own.
+    assert tab_replace("ab\tc\td") == "ab      c       d"
+    assert tab_replace("\t\t1") == " " * 16 + "1"
+    assert tab_replace("1\t2", tabsize=4) == "1   2"
+
+
+def test_tabsize_is_configurable() -> None:
+    patterns = PatternsLib(tabsize=4)
+    patterns.tabs.in_order("key value")
+    assert patterns.tabs == "key\tvalue"
+    assert not patterns.tabs == "key\t\tvalue"
+
+
+def test_expectations_are_compiled_once(patterns: PatternsLib) -> None:
+    patterns.foo.optional("compiled ... line")
+    patterns.bar.refused("compiled ... line")
+    [(_, _, [foo])] = patterns.foo.ops
+    [(_, _, [bar])] = patterns.bar.ops
+    assert isinstance(foo, Expectation)
+    assert foo is bar
+    assert foo is compile_expectation("compiled ... line")
+    assert foo.match("compiled matching line")
+    assert not foo.match("compiled line")
+
+
+def test_empty_line_expectation() -> None:
+    assert match("<empty-line>", "")
+    assert match("<empty-line>", "<empty-line>")
+    assert not match("<empty-line>", " ")
+    assert not match("", "x")
+
+
+def test_tabs_are_matched_expanded_but_reported_verbatim(
+    patterns: PatternsLib,
+) -> None:
+    patterns.tabs.in_order("pre>    aligned text")
+    audit = patterns.tabs._audit("pre>\taligned text")
+    assert audit.normalized == ["pre>    aligned text"]
+    assert list(audit.report()) == [
+        *GENERIC_HEADER,
+        "🟢 tabs            | pre>\taligned text",
+    ]
+    assert audit.is_ok()
 
 
 def test_patternslib_multiple_accesses(patterns: PatternsLib) -> None:
@@ -212,6 +261,7 @@ Line 1
     ]
     assert not audit.is_ok()
 
+
 def test_refused_lines_fail(patterns: PatternsLib) -> None:
     pattern = patterns.refused
     pattern.refused("This is a refused line")
@@ -0,0 +1,1207 @@
+from __future__ import annotations
+
+import concurrent.futures
+import io
+import json
+import mmap
+import os
+import pathlib
+import pickle
+import pstats
+import random
+import re
+import subprocess
+import sys
+from typing import Any
+
+import pytest
+
+from pytest_patterns.plugin import (
+    LINE_BREAKS,
+    Audit,
+    AuditExporter,
+    AuditProfiler,
+    ExpectationGroup,
+    LineBuffer,
+    MappedLines,
+    Pattern,
+    PatternsLib,
+    PatternTimings,
+    SharedContent,
+    Status,
+    StreamAudit,
+    Verdict,
+    audit_op,
+    compile_expectation,
+    compile_expectations,
+    encoded_line_breaks,
+    line_spans,
+    pytest_assertrepr_compare,
+    stream_lines,
+    tab_replace,
+)
+
+GENERIC_HEADER = [
+    "String did not meet the expectations.",
+    "",
+    "🟢=EXPECTED | ⚪️=OPTIONAL | 🟡=UNEXPECTED | 🔴=REFUSED/UNMATCHED",
+    "",
+    "Here is the string that was tested: ",
+    "",
+]
+
+
+def random_line(rng: random.Random, alphabet: str = "ab.\t") -> str:
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 6)))
+
+
+def test_expectation_group_matches_like_single_expectations() -> None:
+    rng = random.Random(42)
+    for _ in range(200):
+        expectations = [
+            compile_expectation(random_line(rng, "ab.")) for _ in range(5)
+        ]
+        group = ExpectationGroup(expectations)
+        for _ in range(20):
+            line = random_line(rng)
+            expected = [e for e in expectations if e.match(line)]
+            assert group.match(line) == bool(expected)
+            assert group.matching(line) == expected
+
+
+def test_expectation_group_handles_empty_line_marker() -> None:
+    group = ExpectationGroup([compile_expectation("<empty-line>")])
+    assert group.match("")
+    assert group.match("<empty-line>")
+    assert not group.match(" ")
+
+
+def test_expectation_group_without_expectations() -> None:
+    group = ExpectationGroup([])
+    assert not group.match("")
+    assert group.matching("anything") == []
+
+
+def test_expectation_group_with_deeply_nested_prefixes() -> None:
+    group = ExpectationGroup(
+        [compile_expectation("x" * i + "a") for i in range(1, 300)]
+    )
+    assert group.match("x" * 250 + "a")
+    assert not group.match("x" * 250 + "b")
+    assert not group.match("x" * 300 + "a")
+
+
+def test_refused_reports_every_matching_expectation(
+    patterns: PatternsLib,
+) -> None:
+    pattern = patterns.refused
+    pattern.refused(
+        """
+...error...
+...fatal...
+...warning...
+"""
+    )
+
+    audit = pattern._audit("fatal error\nall good")
+    assert list(audit.report())[:8] == [
+        *GENERIC_HEADER,
+        "🔴 refused         | fatal error",
+        "🟡                 | all good",
+    ]
+    assert audit.matched_refused == {
+        ("refused", "...error..."),
+        ("refused", "...fatal..."),
+    }
+
+
+def test_audit_stores_content_in_columns(patterns: PatternsLib) -> None:
+    pattern = patterns.columns
+    pattern.optional("a")
+    pattern.refused("b")
+
+    audit = pattern._audit("a\nb\nc")
+    assert audit.lines == ["a", "b", "c"]
+    assert audit.statuses == bytearray(
+        [Status.OPTIONAL.value, Status.REFUSED.value, Status.UNEXPECTED.value]
+    )
+    assert audit.causes == ["", "columns"]
+    assert list(audit.cause_ids) == [1, 1, 0]
+
+    line = audit.content[0]
+    assert (line.data, line.status, line.status_cause) == (
+        "a",
+        Status.OPTIONAL,
+        "columns",
+    )
+    line.mark(Status.EXPECTED, "other")
+    line.mark(Status.OPTIONAL, "ignored")
+    assert (line.status, line.status_cause) == (Status.EXPECTED, "other")
+    assert audit.causes == ["", "columns", "other"]
+
+
+def test_line_buffer_splits_like_splitlines() -> None:
+    rng = random.Random(0)
+    alphabet = ["a", "b", "\t", "\n", "\r", "\r\n", "\x0c", "\x85", "\u2028"]
+    for _ in range(500):
+        content = "".join(
+            rng.choice(alphabet) for _ in range(rng.randint(0, 8))
+        )
+        lines = LineBuffer(content)
+        assert list(lines) == content.splitlines()
+        assert [lines[i] for i in range(len(lines))] == content.splitlines()
+        assert lines[1:] == content.splitlines()[1:]
+        assert list(lines.expandtabs(4)) == [
+            tab_replace(line, 4) for line in content.splitlines()
+        ]
+
+
+def test_zero_copy_audit_keeps_the_original_content() -> None:
+    content = "a\tb\nc"
+    audit = Audit(content, zero_copy=True)
+    assert isinstance(audit.lines, LineBuffer)
+    assert audit.lines.content is content
+    assert list(audit.normalized) == ["a       b", "c"]
+
+
+def test_report_collapses_matched_lines(patterns: PatternsLib) -> None:
+    pattern = patterns.collapse
+    pattern.optional("ok...")
+    lines = [f"ok {i}" for i in range(20)]
+    lines[3] = lines[7] = lines[15] = "fail"
+    audit = pattern._audit("\n".join(lines))
+
+    assert list(audit.report(context=1))[len(GENERIC_HEADER) :] == [
+        "... 2 matched lines ...",
+        "⚪️ collapse        | ok 2",
+        "🟡                 | fail",
+        "⚪️ collapse        | ok 4",
+        # A single line is shown instead of a marker.
+        "⚪️ collapse        | ok 5",
+        "⚪️ collapse        | ok 6",
+        "🟡                 | fail",
+        "⚪️ collapse        | ok 8",
+        "... 5 matched lines ...",
+        "⚪️ collapse        | ok 14",
+        "🟡                 | fail",
+        "⚪️ collapse        | ok 16",
+        "... 3 matched lines ...",
+    ]
+    assert list(audit.report(context=0))[-2:] == [
+        "🟡                 | fail",
+        "... 4 matched lines ...",
+    ]
+    assert len(list(audit.report())) == len(GENERIC_HEADER) + 20
+    audit = pattern._audit("ok 0\nok 1")
+    assert list(audit.report(context=0))[len(GENERIC_HEADER) :] == [
+        "... 2 matched lines ..."
+    ]
+    audit = pattern._audit("ok 0")
+    assert list(audit.report(context=0))[len(GENERIC_HEADER) :] == [
+        "⚪️ collapse        | ok 0"
+    ]
+
+
+def test_report_context_is_configurable(
+    patterns: PatternsLib,
+    pytestconfig: pytest.Config,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    pattern = patterns.collapse
+    pattern.optional("ok...")
+    content = "\n".join(["fail"] + [f"ok {i}" for i in range(10)])
+
+    getini = pytestconfig.getini
+    monkeypatch.setattr(
+        pytestconfig,
+        "getini",
+        lambda name: "2" if name == "patterns_report_context" else getini(name),
+    )
+    monkeypatch.setattr(pytestconfig.option, "verbose", 0)
+    report = pytest_assertrepr_compare(pytestconfig, "==", pattern, content)
+    assert report is not None
+    assert report[len(GENERIC_HEADER) :] == [
+        "🟡                 | fail",
+        "⚪️ collapse        | ok 0",
+        "⚪️ collapse        | ok 1",
+        "... 8 matched lines ...",
+        "",
+        "Matched lines were collapsed, use -vv to show all.",
+    ]
+
+    monkeypatch.setattr(pytestconfig.option, "verbose", 2)
+    report = pytest_assertrepr_compare(pytestconfig, "==", pattern, content)
+    assert report is not None
+    assert len(report) == len(GENERIC_HEADER) + 11
+
+
+def test_reports_are_written_to_the_report_dir(
+    patterns: PatternsLib,
+    pytestconfig: pytest.Config,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+) -> None:
+    pattern = patterns.summary
+    pattern.optional("ok...")
+    pattern.refused("bad")
+    pattern.in_order("start\nend")
+    content = "\n".join(["start", *[f"ok {i}" for i in range(10)], "bad", "?"])
+
+    report_dir = tmp_path / "reports"
+    monkeypatch.setattr(
+        pytestconfig.option, "patterns_report_dir", str(report_dir)
+    )
+    report = pytest_assertrepr_compare(pytestconfig, "==", pattern, content)
+    path = (
+        report_dir
+        / "tests_test_engine.py_test_reports_are_written_to_the_report_dir.txt"
+    )
+    assert report == [
+        "String did not meet the expectations.",
+        "",
+        (
+            "13 lines were tested: 1 🟢=EXPECTED, 10 ⚪️=OPTIONAL, "
+            "1 🟡=UNEXPECTED, 1 🔴=REFUSED"
+        ),
+        "",
+        (
+            "These are the first 2 of 2 unexpected or refused lines "
+            "(with line numbers): "
+        ),
+        "",
+        "    12: 🔴 summary         | bad",
+        "    13: 🟡                 | ?",
+        "",
+        "These are the first 1 of 1 unmatched expected lines: ",
+        "",
+        "🔴 summary         | end",
+        "",
+        f"The full report is in {path}",
+    ]
+    audit = pattern._audit(content)
+    assert path.read_text(encoding="utf-8").splitlines() == list(audit.report())
+    # Further reports of the same test do not overwrite the first.
+    pytest_assertrepr_compare(pytestconfig, "==", pattern, content)
+    assert path.with_name(path.stem + "-2.txt").exists()
+
+
+def test_report_can_be_written_to_a_file(
+    patterns: PatternsLib, tmp_path: pathlib.Path
+) -> None:
+    pattern = patterns.written
+    pattern.in_order("a")
+    audit = pattern._audit("a\nb")
+    audit.write_report(tmp_path / "report.txt")
+    assert (tmp_path / "report.txt").read_text(encoding="utf-8") == "".join(
+        line + "\n" for line in audit.report()
+    )
+
+
+def test_failed_audits_are_exported_as_json_lines(
+    tmp_path: pathlib.Path,
+) -> None:
+    path = tmp_path / "audits" / "audits.jsonl"
+    patterns = PatternsLib(exporter=AuditExporter(path))
+    pattern = patterns.exported
+    pattern.in_order("a\nmissing")
+    pattern.optional("bé")
+    pattern.refused("boom")
+
+    assert pattern == "a\nmissing"
+    assert not path.exists()
+    assert not pattern == "a\nbé\nboom"
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    header, *details = records
+    assert header["record"] == "audit"
+    assert header["test"].endswith(
+        "test_failed_audits_are_exported_as_json_lines"
+    )
+    assert header["pattern"] == "exported"
+    assert header["fingerprint"] == pattern.plan().fingerprint
+    assert not header["ok"]
+    assert header["lines"] == 3
+    assert header["statuses"]["EXPECTED"] == 1
+    assert header["statuses"]["REFUSED"] == 1
+    assert [t["op"] for t in header["timings"]] == [
+        "in_order",
+        "optional",
+        "refused",
+    ]
+    assert all(r["audit"] == header["audit"] for r in details)
+    assert details == [
+        {
+            "record": "line",
+            "audit": header["audit"],
+            "number": 1,
+            "status": "EXPECTED",
+            "cause": "exported",
+            "line": "a",
+        },
+        {
+            "record": "line",
+            "audit": header["audit"],
+            "number": 2,
+            "status": "OPTIONAL",
+            "cause": "exported",
+            "line": "bé",
+        },
+        {
+            "record": "line",
+            "audit": header["audit"],
+            "number": 3,
+            "status": "REFUSED",
+            "cause": "exported",
+            "line": "boom",
+        },
+        {
+            "record": "unmatched",
+            "audit": header["audit"],
+            "cause": "exported",
+            "expectation": "missing",
+        },
+        {
+            "record": "refused",
+            "audit": header["audit"],
+            "cause": "exported",
+            "expectation": "boom",
+        },
+    ]
+
+
+def test_passing_audits_can_be_exported(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "audits.jsonl"
+    patterns = PatternsLib(exporter=AuditExporter(path, passing=True))
+    patterns.exported.optional("a")
+
+    assert patterns.exported == "a"
+    assert not patterns.derive().exported == "a\nb"
+    headers = [
+        record
+        for record in map(json.loads, path.read_text().splitlines())
+        if record["record"] == "audit"
+    ]
+    assert [header["ok"] for header in headers] == [True, False]
+
+
+def test_timings_count_scanned_lines_and_regex_evaluations() -> None:
+    timings = PatternTimings()
+    patterns = PatternsLib(timings=timings)
+    patterns.base.optional("noise ...")
+    patterns.base.refused("boom")
+    patterns.timed.merge("base")
+    patterns.timed.in_order("start")
+
+    assert patterns.timed == "start\nnoise 1\nnoise 2"
+    assert patterns.timed == "start\nnoise 1\nnoise 2"
+    assert not patterns.derive().timed == "start\nboom"
+    optional = timings.ops["base", "optional"]
+    # The second comparison reuses the kept audit.
+    assert optional.calls == 2
+    assert optional.lines == 3 + 2
+    assert optional.evaluations == 3 + 2
+    refused = timings.ops["base", "refused"]
+    assert (refused.lines, refused.evaluations) == (0, 0)
+    assert timings.patterns()["base"].calls == 4
+    report = list(timings.report(1))
+    assert report[1].endswith("  base")
+    assert len(report) == 5
+
+
+def test_profiler_profiles_comparisons_and_audits(
+    tmp_path: pathlib.Path,
+) -> None:
+    profiler = AuditProfiler(tmp_path / "audits.pstats", per_test=True)
+    patterns = PatternsLib(profiler=profiler)
+    patterns.profiled.in_order("a")
+
+    assert patterns.profiled == "a"
+    assert not patterns.profiled == "b"
+    patterns.profiled.audit_stream(["a"])
+    patterns.profiled._audit("b")
+    assert list(profiler.profiles) == [os.environ["PYTEST_CURRENT_TEST"][:-7]]
+    profiler.write()
+    stats = pstats.Stats(str(tmp_path / "audits.pstats"))
+    # The raw statistics are not part of the typeshed stubs.
+    raw: dict[Any, Any] = stats.stats  # type: ignore[attr-defined]
+    calls = {
+        function: call_count
+        for (_, _, function), (_, call_count, *_) in raw.items()
+    }
+    assert calls["__eq__"] == 2
+    assert calls["decide"] == 2
+    assert calls["_audit"] == 1
+    assert calls["audit_stream"] == 1
+    tests = list((tmp_path / "audits-tests").iterdir())
+    assert [path.name for path in tests] == [
+        (
+            "tests_test_engine.py_test_profiler_profiles_comparisons"
+            "_and_audits.pstats"
+        )
+    ]
+
+
+TIMINGS_TEST = """
+def test_output(patterns):
+    patterns.output.optional("line ...")
+    assert patterns.output == "line 1\\nline 2"
+"""
+
+
+def test_timings_are_shown_in_the_terminal_summary(
+    tmp_path: pathlib.Path,
+) -> None:
+    (tmp_path / "test_output.py").write_text(TIMINGS_TEST)
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pytest",
+            "-p",
+            "no:cacheprovider",
+            "--patterns-timings=5",
+        ],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    summary = result.stdout.split(" pattern timings ", 1)[1].splitlines()
+    assert summary[2].split()[1:] == ["1", "2", "2", "output"]
+    assert summary[5].split()[1:] == ["1", "2", "2", "output", "/", "optional"]
+
+
+def test_failed_comparison_reports_the_kept_audit(
+    patterns: PatternsLib, pytestconfig: pytest.Config
+) -> None:
+    pattern = patterns.kept
+    pattern.in_order("expected")
+    content = "unexpected"
+
+    assert not pattern == content
+    audit = pattern._audit(content)
+    assert pattern._audit(content) is audit
+    assert pytest_assertrepr_compare(
+        pytestconfig, "==", pattern, content
+    ) == list(audit.report())
+    # The report does not keep the audit alive.
+    assert pattern._last_audit is None
+
+
+def test_kept_audit_is_invalidated_by_changes(patterns: PatternsLib) -> None:
+    pattern = patterns.kept
+    pattern.merge("base")
+    content = "line"
+
+    audit = pattern._audit(content)
+    assert not audit.is_ok()
+    patterns.base.optional("line")
+    assert pattern._audit(content) is not audit
+    assert pattern._audit(content).is_ok()
+    # Equal, but not identical content is audited again.
+    assert pattern._audit("".join(["li", "ne"])) is not audit
+
+
+def test_audits_are_not_kept_if_disabled() -> None:
+    pattern = PatternsLib(keep_audit=False).kept
+    content = "line"
+    assert pattern._audit(content) is not pattern._audit(content)
+    assert pattern._last_audit is None
+
+
+def test_plan_contains_diamond_merges_once(patterns: PatternsLib) -> None:
+    patterns.base.refused("boom")
+    patterns.left.merge("base")
+    patterns.left.optional("left")
+    patterns.right.merge("base")
+    patterns.right.optional("right")
+    pattern = patterns.top
+    pattern.merge("left", "right")
+    pattern.in_order("top")
+
+    assert [(op, name) for op, name, _ in pattern.flat_ops()] == [
+        ("refused", "base"),
+        ("optional", "left"),
+        ("optional", "right"),
+        ("in_order", "top"),
+    ]
+    audit = pattern._audit("top\nboom")
+    assert audit.unmatched_expectations == []
+    assert audit.matched_refused == {("base", "boom")}
+
+
+def test_plan_reports_cycles(patterns: PatternsLib) -> None:
+    patterns.a.merge("b")
+    patterns.b.merge("c")
+    patterns.c.merge("b")
+    with pytest.raises(ValueError, match="'b' merges itself: b -> c -> b"):
+        patterns.a.plan()
+    patterns.d.merge("d")
+    with pytest.raises(ValueError, match="'d' merges itself: d -> d"):
+        patterns.d.plan()
+
+
+def test_plan_is_kept_until_involved_patterns_change(
+    patterns: PatternsLib,
+) -> None:
+    patterns.base.optional("a")
+    pattern = patterns.top
+    pattern.merge("base")
+
+    plan = pattern.plan()
+    assert pattern.plan() is plan
+    patterns.unrelated.optional("b")
+    assert pattern.plan() is plan
+    patterns.base.optional("c")
+    assert pattern.plan() is not plan
+    assert len(pattern.flat_ops()) == 2
+
+
+def test_plan_follows_merge_order(patterns: PatternsLib) -> None:
+    for name in "zyxwvu":
+        getattr(patterns, name).optional(name)
+    patterns.top.merge("w", "z", "u")
+    patterns.top.merge("y", "w", "x", "v")
+    assert [name for _, name, _ in patterns.top.flat_ops()] == list("wzuyxv")
+
+
+FINGERPRINT_SCRIPT = """
+from pytest_patterns.plugin import PatternsLib
+
+patterns = PatternsLib()
+for name in ["alpha", "beta", "gamma", "delta", "epsilon", "zeta"]:
+    getattr(patterns, name).optional(name + " ...")
+    patterns.top.merge(name)
+patterns.top.in_order("top")
+print(patterns.top.plan().fingerprint)
+"""
+
+
+def test_plan_fingerprint_is_stable_across_processes() -> None:
+    fingerprints = set()
+    for seed in ["0", "1", "42", "random"]:
+        result = subprocess.run(
+            [sys.executable, "-c", FINGERPRINT_SCRIPT],
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        fingerprints.add(result.stdout.strip())
+    assert len(fingerprints) == 1
+
+
+def test_plan_fingerprint_reflects_ops(patterns: PatternsLib) -> None:
+    patterns.a.optional("a")
+    patterns.b.optional("b")
+    patterns.ab.merge("a", "b")
+    patterns.ba.merge("b", "a")
+    fingerprint = patterns.ab.plan().fingerprint
+    assert len(fingerprint) == 64
+    assert patterns.ba.plan().fingerprint != fingerprint
+    patterns.c.optional("a")
+    patterns.c.optional("b")
+    assert patterns.c.plan().fingerprint != fingerprint
+
+
+def test_derived_libraries_copy_patterns_on_write() -> None:
+    base = PatternsLib()
+    base.a.optional("a")
+    base.top.merge("a")
+    base.top.in_order("top")
+
+    derived = base.derive()
+    assert derived.top == "top\na"
+    assert derived.top.plan().ops is base.top.plan().ops
+    derived.a.optional("b")
+    assert derived.top == "top\nb"
+    assert derived.top.plan().ops is not base.top.plan().ops
+    assert derived.top.flat_ops()[0][2] is base.top.flat_ops()[0][2]
+
+    assert not base.top == "top\nb"
+    other = base.derive()
+    assert not other.top == "top\nb"
+    other.top.refused("a")
+    assert not other.top == "top\na"
+    assert derived.top == "top\na"
+
+
+def test_frozen_libraries_refuse_changes() -> None:
+    base = PatternsLib()
+    base.a.optional("a")
+    base.freeze()
+    with pytest.raises(RuntimeError, match="frozen"):
+        base.a.optional("b")
+    with pytest.raises(AttributeError, match="frozen"):
+        base.unknown  # noqa: B018
+    assert base.a.flat_ops()[0][2].expectations[0].pattern == "a"
+
+    derived = base.derive()
+    derived.freeze()
+    nested = derived.derive()
+    nested.a.refused("b")
+    assert not nested.a == "b"
+    assert base.a.ops == derived.a.ops
+
+
+def test_session_patterns_can_be_derived(
+    session_patterns: PatternsLib,
+) -> None:
+    patterns = session_patterns.derive()
+    patterns.session.optional("...")
+    assert patterns.session == "anything"
+    assert session_patterns._resolve("session") is None
+
+
+def reference_audit(pattern: Pattern, content: str) -> dict[str, Any]:
+    """Audit content with the original, straightforward algorithm."""
+    lines = content.splitlines()
+    statuses = [(Status.UNEXPECTED, "")] * len(lines)
+    unmatched = []
+    matched_refused = set()
+
+    def mark(position: int, status: Status, name: str) -> None:
+        if status.value > statuses[position][0].value:
+            statuses[position] = (status, name)
+
+    def matches(expected: str, position: int) -> bool:
+        regex = compile_expectation(expected).regex
+        return regex.match(tab_replace(lines[position])) is not None
+
+    for op, name, expectations in pattern.flat_ops():
+        expected_lines = [e.pattern for e in expectations]
+        if op == "in_order":
+            cursor = iter(range(len(lines)))
+            have_some_match = False
+            for expected in expected_lines:
+                for position in cursor:
+                    if matches(expected, position):
+                        mark(position, Status.EXPECTED, name)
+                        have_some_match = True
+                        break
+                else:
+                    unmatched.append((name, expected))
+                    if not have_some_match:
+                        cursor = iter(range(len(lines)))
+        elif op in ("optional", "refused"):
+            status = Status.OPTIONAL if op == "optional" else Status.REFUSED
+            for expected in expected_lines:
+                for position in range(len(lines)):
+                    if matches(expected, position):
+                        mark(position, status, name)
+                        if op == "refused":
+                            matched_refused.add((name, expected))
+        elif op == "continuous":
+            index = 0
+            for position in range(len(lines)):
+                if index and not lines[position]:
+                    mark(position, Status.OPTIONAL, name)
+                    continue
+                if matches(expected_lines[index], position):
+                    mark(position, Status.EXPECTED, name)
+                    index += 1
+                    if index == len(expected_lines):
+                        break
+                elif index:
+                    mark(position, Status.REFUSED, name)
+                    unmatched.extend((name, e) for e in expected_lines[index:])
+                    break
+            else:
+                unmatched.extend((name, e) for e in expected_lines[index:])
+    return {
+        "statuses": statuses,
+        "unmatched": unmatched,
+        "matched_refused": matched_refused,
+    }
+
+
+def summarize(audit: Audit) -> dict[str, Any]:
+    return {
+        "statuses": [
+            (line.status, line.status_cause) for line in audit.content
+        ],
+        "unmatched": audit.unmatched_expectations,
+        "matched_refused": audit.matched_refused,
+    }
+
+
+CONTENT_LINES = ["a", "b", "a b", "b a", "", "\tb", "a\tb", "<empty-line>"]
+PATTERN_LINES = ["a", "b", "a b", "a...", "...b", "...", "<empty-line>", "c"]
+
+
+def random_pattern(rng: random.Random, patterns: PatternsLib) -> Pattern:
+    pattern = patterns.random
+    for i in range(rng.randint(1, 5)):
+        op = rng.choice(["in_order", "optional", "refused", "continuous"])
+        lines = [rng.choice(PATTERN_LINES) for _ in range(rng.randint(1, 4))]
+        part = getattr(patterns, f"part{i}")
+        getattr(part, op)("\n".join(lines))
+        pattern.merge(part.name)
+    return pattern
+
+
+def random_content(rng: random.Random, size: int = 12) -> str:
+    return "\n".join(
+        rng.choice(CONTENT_LINES) for _ in range(rng.randint(0, size))
+    )
+
+
+def check_audit(rng: random.Random, *, zero_copy: bool) -> None:
+    pattern = random_pattern(rng, PatternsLib(zero_copy=zero_copy))
+    content = random_content(rng)
+    assert summarize(pattern._audit(content)) == reference_audit(
+        pattern, content
+    )
+
+
+def check_stream(rng: random.Random, *, zero_copy: bool) -> None:
+    pattern = random_pattern(rng, PatternsLib(zero_copy=zero_copy))
+    content = random_content(rng)
+    audit = pattern._audit(content)
+    stream = pattern.audit_stream(io.StringIO(content), context=None)
+    assert stream.is_ok() == audit.is_ok()
+    assert stream.unmatched_expectations == audit.unmatched_expectations
+    assert stream.matched_refused == audit.matched_refused
+    report = list(audit.report())
+    size = len(GENERIC_HEADER) + len(audit.lines)
+    assert list(stream.report())[:size] == report[:size]
+    # The unmatched and refused expectations follow the lines.
+    expectations = len(report) - size
+    for context in range(4):
+        stream = pattern.audit_stream(io.StringIO(content), context=context)
+        report = list(audit.report(context))
+        size = len(report) - expectations
+        stream_report = list(stream.report())
+        assert len(stream_report) == len(report)
+        assert stream_report[:size] == report[:size]
+
+
+def check_instrumented(rng: random.Random, *, zero_copy: bool) -> None:
+    patterns = PatternsLib(
+        zero_copy=zero_copy, keep_audit=False, timings=PatternTimings()
+    )
+    pattern = random_pattern(rng, patterns)
+    content = random_content(rng)
+    assert summarize(pattern._audit(content)) == reference_audit(
+        pattern, content
+    )
+
+
+def check_parallel(rng: random.Random, *, zero_copy: bool) -> None:
+    pattern = random_pattern(rng, PatternsLib())
+    content = random_content(rng)
+    audit = Audit(content, zero_copy=zero_copy)
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        audit.run_parallel(
+            content, pattern.flat_ops(), pool, chunks=rng.randint(1, 4)
+        )
+    assert summarize(audit) == reference_audit(pattern, content)
+
+
+def check_verdict(rng: random.Random, *, zero_copy: bool) -> None:
+    pattern = random_pattern(rng, PatternsLib(zero_copy=zero_copy))
+    content = random_content(rng)
+    if rng.random() < 0.2:
+        # Other line breaks than "\n" take the line by line path.
+        content = content.replace("\n", "\r\n")
+    verdict = Verdict(content, zero_copy=zero_copy)
+    assert verdict.decide(pattern.plan()) == pattern._audit(content).is_ok()
+
+
+# Implementations that must agree with the reference implementation (or
+# with `Audit`, which does), on random patterns and content.
+IMPLEMENTATIONS = {
+    "audit": check_audit,
+    "verdict": check_verdict,
+    "stream": check_stream,
+    "instrumented": check_instrumented,
+    "parallel": check_parallel,
+}
+
+
+@pytest.mark.parametrize("implementation", IMPLEMENTATIONS)
+def test_implementation_matches_reference(implementation: str) -> None:
+    check = IMPLEMENTATIONS[implementation]
+    for seed in range(300):
+        try:
+            check(random.Random(seed), zero_copy=bool(seed % 2))
+        except AssertionError as error:
+            msg = f"{implementation} differs for seed {seed}"
+            raise AssertionError(msg) from error
+
+
+def test_in_order_matches_reference_implementation(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # Classify lines after the first unmatched expectation.
+    monkeypatch.setattr("pytest_patterns.plugin.CLASSIFY_MIN_EXPECTATIONS", 0)
+    for seed in range(300):
+        rng = random.Random(seed)
+        patterns = PatternsLib(zero_copy=bool(seed % 2))
+        pattern = patterns.ordered
+        for i in range(rng.randint(1, 3)):
+            lines = [
+                rng.choice(PATTERN_LINES) for _ in range(rng.randint(1, 8))
+            ]
+            getattr(patterns, f"part{i}").in_order("\n".join(lines))
+            pattern.merge(f"part{i}")
+        content = random_content(rng, 30)
+        assert summarize(pattern._audit(content)) == reference_audit(
+            pattern, content
+        ), f"seed {seed}"
+
+
+def test_in_order_classifies_lines_once() -> None:
+    timings = PatternTimings()
+    pattern = PatternsLib(timings=timings).ordered
+    missing = [f"missing {i} ..." for i in range(20)]
+    pattern.in_order("\n".join([*missing, "found ...", "line 999"]))
+    content = "\n".join(f"line {i}" for i in range(999)) + "\nfound it"
+    audit = pattern._audit(content)
+    assert audit.unmatched_expectations == [
+        *(("ordered", line) for line in missing),
+        ("ordered", "line 999"),
+    ]
+    # After the first missing expectation, the lines are classified once
+    # instead of being scanned again for every following expectation.
+    stats = timings.ops["ordered", "in_order"]
+    assert stats.lines == 2 * 1000
+    assert stats.evaluations == 1000 + 1
+
+
+def test_classify_matches_repeated_expectations_once() -> None:
+    group = compile_expectations("a...\nb\na...\nb")
+    wildcard, literal = group.expectations[:2]
+    for zero_copy in [False, True]:
+        audit = Audit("a1\nb\na2\nb", zero_copy=zero_copy)
+        audit.classify(group)
+        assert list(audit.occurrences(wildcard)) == [0, 2]
+        assert list(audit.occurrences(literal)) == [1, 3]
+
+
+def longest_subsequence(expected: list[str], lines: list[str]) -> int:
+    """Return the length of the longest common subsequence of expectations
+    and lines, by dynamic programming."""
+    longest = [[0] * (len(lines) + 1) for _ in range(len(expected) + 1)]
+    for i, pattern in enumerate(expected):
+        regex = compile_expectation(pattern).regex
+        for j, line in enumerate(lines):
+            match = regex.match(tab_replace(line)) is not None
+            longest[i + 1][j + 1] = max(
+                longest[i][j + 1], longest[i + 1][j], longest[i][j] + match
+            )
+    return longest[-1][-1]
+
+
+def test_in_order_longest_matches_most_expectations() -> None:
+    patterns = PatternsLib()
+    patterns.greedy.in_order("...\na\nb")
+    patterns.longest.in_order("...\na\nb", longest=True)
+    assert patterns.greedy._audit("a\nb").unmatched_expectations == [
+        ("greedy", "a"),
+        ("greedy", "b"),
+    ]
+    audit = patterns.longest._audit("a\nb")
+    assert audit.unmatched_expectations == [("longest", "a")]
+    assert [line.status for line in audit.content] == [Status.EXPECTED] * 2
+
+
+def test_in_order_longest_matches_longest_subsequence() -> None:
+    for seed in range(300):
+        rng = random.Random(seed)
+        patterns = PatternsLib(zero_copy=bool(seed % 2))
+        expected = [rng.choice(PATTERN_LINES) for _ in range(rng.randint(1, 8))]
+        patterns.ordered.in_order("\n".join(expected), longest=True)
+        content = random_content(rng, 30)
+        audit = patterns.ordered._audit(content)
+
+        matched = [
+            line.data
+            for line in audit.content
+            if line.status is Status.EXPECTED
+        ]
+        # All marked lines are matched in order and no longer match exists.
+        longest = longest_subsequence(expected, content.splitlines())
+        unmatched = len(audit.unmatched_expectations)
+        message = f"seed {seed}"
+        assert longest_subsequence(expected, matched) == len(matched), message
+        assert longest == len(matched), message
+        assert unmatched == len(expected) - len(matched), message
+        assert (patterns.ordered == content) is audit.is_ok(), message
+
+
+def test_stream_audit_refuses_in_order_longest() -> None:
+    pattern = PatternsLib().ordered
+    pattern.in_order("a", longest=True)
+    with pytest.raises(ValueError, match="longest=True"):
+        pattern.audit_stream(["a"])
+
+
+def test_parallel_audit_in_worker_processes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr("pytest_patterns.plugin.PARALLEL_MIN_SIZE", 0)
+    content = "start\r\nbé\tb\nnoise\u2028boom\x85end\nnoise"
+    audits = []
+    for workers in [0, 2]:
+        patterns = PatternsLib(workers=workers)
+        patterns.base.optional("noise\nbé b")
+        patterns.base.refused("boom")
+        patterns.parallel.merge("base")
+        patterns.parallel.in_order("start\nmissing\nend")
+        patterns.parallel.continuous("noise\nboom")
+        assert not patterns.parallel == content
+        # Comparisons are decided by the verdict, even for large content.
+        assert patterns.parallel._last_audit is None
+        audits.append(patterns.parallel._audit(content))
+    sequential, parallel = audits
+    assert summarize(parallel) == summarize(sequential)
+    assert [op for op, _, _ in parallel.timings] == [
+        "optional",
+        "refused",
+        "in_order",
+        "continuous",
+    ]
+
+
+def test_parallel_audit_only_sends_chunked_ops_to_workers(
+    patterns: PatternsLib, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    pattern = patterns.chunked
+    pattern.optional("a")
+    pattern.in_order("a")
+    pattern.refused("b")
+    pattern.continuous("a")
+    content = "a\nb\na\nc"
+    sent = []
+
+    def send(*args: Any) -> Any:
+        sent.append(args[3][0])
+        return audit_op(*args)
+
+    monkeypatch.setattr("pytest_patterns.plugin.audit_op", send)
+    audit = Audit(content)
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        audit.run_parallel(content, pattern.flat_ops(), pool, chunks=2)
+    assert sent == ["optional", "optional", "refused", "refused"]
+    assert summarize(audit) == reference_audit(pattern, content)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_line_spans_split_at_line_boundaries(seed: int) -> None:
+    rng = random.Random(seed)
+    content = "".join(
+        rng.choice(["a", "é", "", "\t"])
+        + rng.choice(["\n", "\r\n", "\r", "\x85", "\u2028", "\x0c"])
+        for _ in range(rng.randint(0, 12))
+    ) + rng.choice(["", "end"])
+    parts = rng.randint(1, 5)
+    inputs: list[tuple[str | bytes, re.Pattern[Any]]] = [
+        (content, LINE_BREAKS),
+        (content.encode(), encoded_line_breaks("utf-8")),
+    ]
+    for data, line_breaks in inputs:
+        spans = line_spans(data, parts, line_breaks)
+        assert 1 <= len(spans) <= parts
+        assert spans[0][0] == 0
+        assert spans[-1][1] == len(data)
+        assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+        lines: list[str] = []
+        for start, end in spans:
+            chunk = data[start:end]
+            text = chunk if isinstance(chunk, str) else chunk.decode()
+            lines.extend(text.splitlines())
+        assert lines == content.splitlines()
+
+
+def test_shared_content_is_sent_by_name() -> None:
+    content = "a\nbé\n\ud800"
+    shared = SharedContent(content)
+    try:
+        data = pickle.dumps(shared)
+        assert len(data) < 200
+        copy = pickle.loads(data)  # noqa: S301
+        assert copy.read(0, shared.size) == content
+        assert copy.read(*shared.spans(2)[1]) == "\ud800"
+    finally:
+        shared.close()
+
+
+def test_comparison_does_not_audit_completely(
+    patterns: PatternsLib, pytestconfig: pytest.Config
+) -> None:
+    pattern = patterns.verdict
+    pattern.in_order("a")
+    pattern.refused("b")
+
+    assert pattern == "a"
+    assert pattern._last_audit is None
+    assert not pattern == "a\nb"
+    assert pattern._last_audit is None
+    # The failure report is based on a complete audit.
+    report = pytest_assertrepr_compare(pytestconfig, "==", pattern, "a\nb")
+    assert report is not None
+    assert report[6:8] == [
+        "🟢 verdict         | a",
+        "🔴 verdict         | b",
+    ]
+
+
+def test_verdict_stops_at_the_first_disallowed_line(
+    patterns: PatternsLib,
+) -> None:
+    pattern = patterns.early
+    pattern.optional("a")
+    content = "a\nx\n" + "a\n" * 1000 + "x"
+
+    verdict = Verdict(content)
+    assert not verdict.decide(pattern.plan())
+    # Only the lines up to the first line that is not tolerated were looked at.
+    assert verdict.counted == (1, 2)
+
+
+def test_verdict_finds_refused_empty_lines(patterns: PatternsLib) -> None:
+    pattern = patterns.empty
+    pattern.optional("...")
+    pattern.refused("<empty-line>")
+
+    assert Verdict("a\nb").decide(pattern.plan())
+    assert not Verdict("a\n\nb").decide(pattern.plan())
+    assert not Verdict("a\n<empty-line>").decide(pattern.plan())
+
+
+def test_plan_combines_optional_ops(patterns: PatternsLib) -> None:
+    pattern = patterns.tolerant
+    pattern.optional("a...")
+    pattern.optional("b")
+    plan = pattern.plan()
+    assert [e.pattern for e in plan.tolerated] == ["a...", "b"]
+    assert plan.tolerated is plan.tolerated
+    # The combined group belongs to the plan and goes away with it.
+    pattern.optional("c")
+    assert [e.pattern for e in pattern.plan().tolerated] == ["a...", "b", "c"]
+
+
+def test_stream_audit_collapses_matched_lines(patterns: PatternsLib) -> None:
+    pattern = patterns.stream
+    pattern.optional("ok...")
+    pattern.refused("fail")
+
+    lines = [f"ok {i}" for i in range(20)]
+    lines[10] = "fail"
+    stream = pattern.audit_stream(lines, context=2)
+    assert not stream.is_ok()
+    assert list(stream.report()) == [
+        *GENERIC_HEADER,
+        "... 8 matched lines ...",
+        "⚪️ stream          | ok 8",
+        "⚪️ stream          | ok 9",
+        "🔴 stream          | fail",
+        "⚪️ stream          | ok 11",
+        "⚪️ stream          | ok 12",
+        "... 7 matched lines ...",
+        "",
+        "These are the matched refused lines: ",
+        "",
+        "🔴 stream          | fail",
+    ]
+    assert stream.counts[Status.OPTIONAL] == 19
+
+
+def test_stream_audit_restarts_in_order(patterns: PatternsLib) -> None:
+    pattern = patterns.stream
+    pattern.in_order(
+        """
+a
+b
+c
+"""
+    )
+    # The op restarts at "a" and withdraws the earlier matches.
+    stream = pattern.audit_stream(["b", "c", "a", "b", "c"], context=0)
+    assert stream.unmatched_expectations == []
+    assert list(stream.report())[len(GENERIC_HEADER) :] == [
+        "🟡                 | b",
+        "🟡                 | c",
+        "... 3 matched lines ...",
+    ]
+    stream = pattern.audit_stream(["b", "c", "x", "c"], context=0)
+    assert stream.unmatched_expectations == [("stream", "a")]
+    assert list(stream.report())[len(GENERIC_HEADER) :] == [
+        "... 2 matched lines ...",
+        "🟡                 | x",
+        "🟡                 | c",
+        "",
+        "These are the unmatched expected lines: ",
+        "",
+        "🔴 stream          | a",
+    ]
+
+
+def test_stream_audit_keeps_only_held_lines(patterns: PatternsLib) -> None:
+    pattern = patterns.stream
+    pattern.in_order("header\nfooter")
+    pattern.optional("line ...")
+    stream = StreamAudit(pattern.flat_ops(), context=2)
+    lines = [f"line {i}" for i in range(1000)]
+    lines[500] = "unexpected"
+    for line in ["footer", *lines]:
+        stream.feed(line)
+    # The footer is held until the op is decided, the lines after it are
+    # counted and only those that may still be reported are kept.
+    assert len(stream._queue) == 4
+    assert stream.counts[Status.OPTIONAL] == 999
+    stream.close()
+    assert not stream._queue
+    assert stream.counts[Status.EXPECTED] == 1
+    audit = pattern._audit("\n".join(["footer", *lines]))
+    assert list(stream.report()) == list(audit.report(2))
+
+
+def test_stream_lines_splits_like_splitlines() -> None:
+    assert list(stream_lines(io.StringIO("a\n\nb\n"))) == ["a", "", "b"]
+    assert list(stream_lines(["a", "", "b"])) == ["a", "", "b"]
+    assert list(stream_lines([b"a\r\n", "b\x0cc"])) == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "latin-1"])
+def test_file_audit_matches_audit(
+    encoding: str, tmp_path: pathlib.Path
+) -> None:
+    rng = random.Random(0)
+    line_breaks = ["\n", "\r\n", "\r", "\x0c", "\x85"]
+    path = tmp_path / "content.log"
+    for _ in range(100):
+        pattern = random_pattern(rng, PatternsLib())
+        content = "".join(
+            rng.choice([*CONTENT_LINES, "ä"]) + rng.choice(line_breaks)
+            for _ in range(rng.randint(0, 12))
+        )
+        path.write_bytes(content.encode(encoding))
+        audit = pattern.audit_file(path, encoding)
+        assert isinstance(audit.lines, MappedLines)
+        expected = pattern._audit(path.read_text(encoding))
+        assert summarize(audit) == summarize(expected)
+        size = len(GENERIC_HEADER) + len(expected.lines)
+        assert list(audit.report())[:size] == list(expected.report())[:size]
+
+
+def test_file_audit_closes_the_mapping(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "content.log"
+    path.write_text("a\nb\n")
+    pattern = PatternsLib().file
+    pattern.optional("a")
+    with pattern.audit_file(path) as audit:
+        assert isinstance(audit.lines, MappedLines)
+        content = audit.lines.content
+        assert not audit.is_ok()
+    assert isinstance(content, mmap.mmap)
+    assert content.closed
+
+
+def test_file_audit_needs_ascii_compatible_encoding(
+    tmp_path: pathlib.Path,
+) -> None:
+    path = tmp_path / "content.log"
+    path.write_text("a\n", encoding="utf-16")
+    with pytest.raises(ValueError, match="ASCII compatible"):
+        PatternsLib().file.audit_file(path, "utf-16")